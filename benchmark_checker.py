@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Замер производительности check_homework.py на синтетических студентах.
+
+Скрипт создает N студентов с типичными вариантами решений Assignment3/Assignment4
+(рабочее решение, ошибка сборки, утечка памяти, зависающие тесты, нарушения стиля),
+запускает на них main() проверяющего скрипта и сообщает пропускную способность
+(студентов в минуту), процентили времени этапов и пиковую память. Результат каждого
+запуска дописывается в JSONL, чтобы сравнивать скорость проверки между версиями.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import resource
+import tempfile
+import contextlib
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import check_homework
+
+# =============================================================================
+# КОНСТАНТЫ
+# =============================================================================
+
+DEFAULT_STUDENTS = 20
+DEFAULT_TIMEOUT_SECONDS = 5            # Таймаут команд проверяющего скрипта на время замера
+BENCHMARK_RESULTS = "benchmark_results.jsonl"
+VARIANTS = ["passing", "build_failure", "leaking", "timeout", "style"]
+PERCENTILES = [50, 90, 99]
+
+# =============================================================================
+# ШАБЛОНЫ РЕШЕНИЙ
+# =============================================================================
+
+ASSIGNMENT3_FILES = {
+    "Makefile": """CXX=g++
+CXXFLAGS=-Wall -Werror -Wpedantic -std=c++17
+all: main test_main
+main: main.o Robot.o Transformer.o
+\t$(CXX) $(CXXFLAGS) -o main main.o Robot.o Transformer.o
+test_main: test_robot.o Robot.o Transformer.o
+\t$(CXX) $(CXXFLAGS) -o test_main test_robot.o Robot.o Transformer.o
+%.o: %.cpp
+\t$(CXX) $(CXXFLAGS) -c $< -o $@
+test: test_main
+\t./test_main
+clean:
+\trm -f *.o main test_main
+""",
+    "Robot.h": """#ifndef ROBOT_H
+#define ROBOT_H
+
+class Robot {
+public:
+    explicit Robot(int power);
+    virtual ~Robot() = default;
+    virtual int Power() const;
+
+protected:
+    int power_;
+};
+
+#endif
+""",
+    "Robot.cpp": """#include "Robot.h"
+
+Robot::Robot(int power) : power_(power) {}
+
+int Robot::Power() const {
+    return power_;
+}
+""",
+    "Transformer.h": """#ifndef TRANSFORMER_H
+#define TRANSFORMER_H
+
+#include "Robot.h"
+
+class Transformer : public Robot {
+public:
+    explicit Transformer(int power);
+    int Power() const override;
+};
+
+#endif
+""",
+    "Transformer.cpp": """#include "Transformer.h"
+
+Transformer::Transformer(int power) : Robot(power) {}
+
+int Transformer::Power() const {
+    return power_ * 2;
+}
+""",
+    "main.cpp": """#include <iostream>
+#include "Transformer.h"
+
+int main() {
+    Transformer transformer(21);
+    std::cout << transformer.Power() << std::endl;
+    return 0;
+}
+""",
+    "test_robot.cpp": """#include "Transformer.h"
+
+int main() {
+    Transformer transformer(1);
+    return transformer.Power() == 2 ? 0 : 1;
+}
+""",
+}
+
+ASSIGNMENT4_FILES = {
+    "Makefile": """CXX=g++
+CXXFLAGS=-Wall -Werror -Wpedantic -std=c++17
+all: main test_main
+main: main.o Point.o
+\t$(CXX) $(CXXFLAGS) -o main main.o Point.o
+test_main: test_point.o Point.o
+\t$(CXX) $(CXXFLAGS) -o test_main test_point.o Point.o
+%.o: %.cpp
+\t$(CXX) $(CXXFLAGS) -c $< -o $@
+test: test_main
+\t./test_main
+clean:
+\trm -f *.o main test_main
+""",
+    "Point.h": """#ifndef POINT_H
+#define POINT_H
+
+#include <ostream>
+
+class Point {
+public:
+    Point(int x, int y);
+    bool operator==(const Point& other) const;
+    bool operator<(const Point& other) const;
+    friend std::ostream& operator<<(std::ostream& out, const Point& point);
+
+private:
+    int x_;
+    int y_;
+};
+
+#endif
+""",
+    "Point.cpp": """#include "Point.h"
+
+Point::Point(int x, int y) : x_(x), y_(y) {}
+
+bool Point::operator==(const Point& other) const {
+    return x_ == other.x_ && y_ == other.y_;
+}
+
+bool Point::operator<(const Point& other) const {
+    return x_ < other.x_ || (x_ == other.x_ && y_ < other.y_);
+}
+
+std::ostream& operator<<(std::ostream& out, const Point& point) {
+    return out << "(" << point.x_ << ", " << point.y_ << ")";
+}
+""",
+    "main.cpp": """#include <iostream>
+#include "Point.h"
+
+int main() {
+    Point point(1, 2);
+    std::cout << point << std::endl;
+    return 0;
+}
+""",
+    "test_point.cpp": """#include "Point.h"
+
+int main() {
+    return Point(1, 2) < Point(2, 1) && Point(1, 1) == Point(1, 1) ? 0 : 1;
+}
+""",
+}
+
+# Изменения шаблона для каждого варианта: файл -> новое содержимое
+VARIANT_OVERRIDES = {
+    "passing": {},
+    "build_failure": {
+        "main.cpp": """int main() {
+    return undeclared_value
+}
+""",
+    },
+    "leaking": {
+        "main.cpp": """#include <iostream>
+
+int main() {
+    int* values = new int[16];
+    values[0] = 42;
+    std::cout << values[0] << std::endl;
+    return 0;
+}
+""",
+    },
+    "timeout": {
+        "main.cpp": """int main() {
+    volatile bool running = true;
+    while (running) {
+    }
+    return 0;
+}
+""",
+    },
+    "style": {
+        "main.cpp": """#include <iostream>
+int main(){int a=1;int b=2;
+        if(a<b){std::cout<<a<<std::endl;}
+  else{std::cout<<b<<std::endl;}
+            return 0;}
+""",
+    },
+}
+
+# Зависающий тестовый бинарник для варианта timeout
+TIMEOUT_TEST_FILES = {
+    "Assignment3": "test_robot.cpp",
+    "Assignment4": "test_point.cpp",
+}
+
+# =============================================================================
+# ГЕНЕРАЦИЯ СТУДЕНТОВ
+# =============================================================================
+
+def write_assignment(assignment_dir, files, variant):
+    """Файлы одного задания с изменениями варианта"""
+    assignment_dir.mkdir(parents=True, exist_ok=True)
+    contents = {**files, **VARIANT_OVERRIDES[variant]}
+    if variant == "timeout":
+        contents[TIMEOUT_TEST_FILES[assignment_dir.name]] = VARIANT_OVERRIDES["timeout"]["main.cpp"]
+
+    for name, content in contents.items():
+        (assignment_dir / name).write_text(content, encoding="utf-8")
+
+def generate_students(students_dir, count, variants):
+    """count студентов по кругу вариантов; возвращает число студентов каждого варианта"""
+    variant_counts = {}
+    for index in range(count):
+        variant = variants[index % len(variants)]
+        variant_counts[variant] = variant_counts.get(variant, 0) + 1
+
+        base_dir = Path(students_dir) / f"student{index + 1:04d}" / "HomeAssignments"
+        write_assignment(base_dir / "Assignment3", ASSIGNMENT3_FILES, variant)
+        write_assignment(base_dir / "Assignment4", ASSIGNMENT4_FILES, variant)
+
+    return variant_counts
+
+# =============================================================================
+# ЗАМЕР
+# =============================================================================
+
+def percentile(values, percent):
+    """Процентиль методом ближайшего ранга"""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(percent / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def stage_latencies(results_jsonl):
+    """Длительности выполненных этапов из results.jsonl, по именам этапов"""
+    durations = {}
+    with open(results_jsonl, 'r', encoding='utf-8') as f:
+        for line in f:
+            student_result = json.loads(line)
+            for _, check in check_homework.iter_timed_checks(student_result):
+                durations.setdefault(check["name"], []).append(check["duration"])
+
+    return {
+        name: {
+            "count": len(values),
+            **{f"p{percent}": round(percentile(values, percent), 3) for percent in PERCENTILES},
+            "max": round(max(values), 3),
+        }
+        for name, values in durations.items()
+    }
+
+def checker_version():
+    """Хэш кода проверяющего скрипта, чтобы различать замеры разных версий"""
+    return hashlib.sha256(Path(check_homework.__file__).read_bytes()).hexdigest()[:12]
+
+def run_benchmark(args, work_dir):
+    """Генерация студентов и один запуск проверки; возвращает запись с метриками"""
+    students_dir = Path(work_dir) / "students"
+    reports_dir = Path(work_dir) / "reports"
+    variant_counts = generate_students(students_dir, args.students, args.variants)
+
+    check_homework.STUDENTS_DIR = str(students_dir)
+    check_homework.REPORTS_DIR = str(reports_dir)
+    check_homework.CACHE_DIR = str(Path(work_dir) / "cache")
+    check_homework.BUILD_CACHE_DIR = str(Path(work_dir) / "build_cache")
+    check_homework.TIMEOUT_SECONDS = args.timeout
+
+    checker_argv = ["--jobs", str(args.jobs), "--stage-jobs", str(args.stage_jobs),
+                    "--cppcheck-build-dir", str(Path(work_dir) / "cppcheck_cache")]
+    if not args.cache:
+        checker_argv.append("--no-cache")
+    if args.build_cache:
+        checker_argv.append("--build-cache")
+
+    output = open(os.devnull, 'w') if not args.verbose else sys.stdout
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        with contextlib.redirect_stdout(output):
+            check_homework.main(checker_argv)
+    finally:
+        wall_time = time.monotonic() - started
+        _, python_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        if output is not sys.stdout:
+            output.close()
+
+    return {
+        "date": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        "checker_version": checker_version(),
+        "students": args.students,
+        "variants": variant_counts,
+        "jobs": args.jobs,
+        "stage_jobs": args.stage_jobs,
+        "timeout": args.timeout,
+        "cache": args.cache,
+        "build_cache": args.build_cache,
+        "wall_time": round(wall_time, 3),
+        "students_per_minute": round(args.students / wall_time * 60, 2),
+        "main_python_peak_mb": round(python_peak / 1024 ** 2, 1),
+        "main_max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "children_max_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+        "stages": stage_latencies(reports_dir / check_homework.RESULTS_JSONL),
+    }
+
+def previous_record(results_file, record):
+    """Последний замер с теми же параметрами, для сравнения"""
+    keys = ["students", "variants", "jobs", "stage_jobs", "timeout", "cache", "build_cache"]
+    previous = None
+    if Path(results_file).exists():
+        with open(results_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                candidate = json.loads(line)
+                if all(candidate.get(key) == record[key] for key in keys):
+                    previous = candidate
+    return previous
+
+def print_report(record, previous):
+    """Сводка замера в консоль"""
+    print(f"Студентов: {record['students']} ({', '.join(f'{k}: {v}' for k, v in record['variants'].items())})")
+    print(f"Время: {record['wall_time']:.1f} сек, {record['students_per_minute']:.1f} студентов/мин")
+    if previous is not None:
+        change = (record["students_per_minute"] / previous["students_per_minute"] - 1) * 100
+        print(f"  предыдущий замер ({previous['date']}, версия {previous['checker_version']}): "
+              f"{previous['students_per_minute']:.1f} студентов/мин ({change:+.1f}%)")
+    print(f"Пиковая память main(): Python {record['main_python_peak_mb']} МБ, "
+          f"RSS {record['main_max_rss_mb']} МБ; дочерние процессы: {record['children_max_rss_mb']} МБ")
+
+    print("\nЭтап: запусков, " + ", ".join(f"p{percent}" for percent in PERCENTILES) + ", максимум (сек)")
+    for name, stats in sorted(record["stages"].items(), key=lambda item: -item[1]["max"]):
+        values = ", ".join(f"{stats[f'p{percent}']:.2f}" for percent in PERCENTILES)
+        print(f"{name}: {stats['count']}, {values}, {stats['max']:.2f}")
+
+def parse_args(argv=None):
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Замер скорости check_homework.py на синтетических студентах")
+    parser.add_argument("-n", "--students", type=int, default=DEFAULT_STUDENTS,
+                        help=f"количество синтетических студентов (по умолчанию {DEFAULT_STUDENTS})")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=VARIANTS,
+                        help="варианты решений, раздаваемые студентам по кругу")
+    parser.add_argument("-j", "--jobs", type=int, default=check_homework.DEFAULT_JOBS,
+                        help="параллельных студентов (передается в check_homework.py)")
+    parser.add_argument("--stage-jobs", type=int, default=check_homework.DEFAULT_STAGE_JOBS,
+                        help="параллельных этапов задания (передается в check_homework.py)")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT_SECONDS,
+                        help=f"таймаут внешних команд, сек (по умолчанию {DEFAULT_TIMEOUT_SECONDS})")
+    parser.add_argument("--cache", action="store_true",
+                        help="не отключать кэш результатов (по умолчанию каждый замер проверяет всех заново)")
+    parser.add_argument("--build-cache", action="store_true",
+                        help="собирать через ccache (передается в check_homework.py)")
+    parser.add_argument("--work-dir",
+                        help="каталог для студентов и отчетов (по умолчанию временный, удаляется)")
+    parser.add_argument("--output", default=BENCHMARK_RESULTS,
+                        help=f"файл, в который дописываются результаты замеров (по умолчанию {BENCHMARK_RESULTS})")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="показывать вывод проверяющего скрипта")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Основная функция"""
+    args = parse_args(argv)
+    output_path = Path(args.output).absolute()
+
+    if args.work_dir:
+        Path(args.work_dir).mkdir(parents=True, exist_ok=True)
+        record = run_benchmark(args, Path(args.work_dir).absolute())
+    else:
+        with tempfile.TemporaryDirectory(prefix="checker_benchmark_") as work_dir:
+            record = run_benchmark(args, work_dir)
+
+    previous = previous_record(output_path, record)
+    print_report(record, previous)
+
+    with open(output_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    print(f"\nРезультат замера дописан в {output_path}")
+
+if __name__ == "__main__":
+    main()
@@ -2,10 +2,39 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
+import json
+import math
+import shlex
+import shutil
+import difflib
+import hashlib
+import random
+import argparse
+import collections
+import functools
 import subprocess
+import multiprocessing
 import tempfile
 import signal
+import threading
+import time
+import resource
+import select
+import socket
+import sqlite3
+import struct
+import errno
+import tarfile
+import ctypes
+import ctypes.util
+import contextlib
+import contextvars
+import http.server
+from xml.etree import ElementTree
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, as_completed, wait)
 from datetime import datetime
 from pathlib import Path
 
@@ -14,11 +43,14 @@ from pathlib import Path
 # =============================================================================
 
 INITIAL_SCORE = 100
+STUDENTS_DIR = "/app"
 REPORTS_DIR = "/app/reports"
 TIMEOUT_SECONDS = 30
-
-# Пути к заданиям 
-ASSIGNMENTS_TO_CHECK = ["Assignment3", "Assignment4"]
+DEFAULT_JOBS = 1        # Количество студентов, проверяемых параллельно
+DEFAULT_STAGE_JOBS = 4  # Количество одновременно выполняемых этапов проверки задания
+RESULTS_JSONL = "results.jsonl"  # Машиночитаемые результаты, по строке на студента
+RUN_JOURNAL_DIR = "journal"      # Журнал запуска для --resume (в каталоге отчетов)
+OUTPUT_EXCERPT_CHARS = 2000      # Сколько вывода инструмента сохранять в JSONL
 
 # Возможные названия папок с заданиями 
 POSSIBLE_ASSIGNMENT_FOLDER_NAMES = [
@@ -26,6 +58,125 @@ POSSIBLE_ASSIGNMENT_FOLDER_NAMES = [
     "Assignments", "Assignment", "homework", "Homework"
 ]
 
+# Песочница для внешних команд (ограничения на каждый процесс)
+SANDBOX_LIMITS = {
+    "cpu_seconds": 300,                  # Процессорное время
+    "memory_bytes": 4 * 1024 ** 3,       # Адресное пространство
+    "file_size_bytes": 512 * 1024 ** 2,  # Размер создаваемого файла
+    "processes": 4096,                   # Процессов пользователя (для root не действует, см. pids_limit)
+}
+# valgrind и AddressSanitizer резервируют адресное пространство далеко за пределами
+# реального потребления, поэтому для них оно не ограничивается
+MEMORY_CHECK_LIMITS = {**SANDBOX_LIMITS, "memory_bytes": None}
+SANDBOX_RESOURCES = {
+    "cpu_seconds": resource.RLIMIT_CPU,
+    "memory_bytes": resource.RLIMIT_AS,
+    "file_size_bytes": resource.RLIMIT_FSIZE,
+    "processes": resource.RLIMIT_NPROC,
+}
+SANDBOX_PRLIMIT_OPTIONS = {
+    "cpu_seconds": "--cpu",
+    "memory_bytes": "--as",
+    "file_size_bytes": "--fsize",
+    "processes": "--nproc",
+}
+SANDBOX_OUTPUT_HEAD_BYTES = 64 * 1024  # Сколько сохранять от начала вывода
+SANDBOX_OUTPUT_TAIL_BYTES = 64 * 1024  # Сколько сохранять от конца вывода
+SANDBOX_DRAIN_SECONDS = 5              # Сколько дочитывать вывод после завершения команды
+
+# Рабочие каталоги: задание копируется на tmpfs и собирается там, а не на томе с работами
+WORKSPACE_ROOT = "/dev/shm"              # Если недоступен - системный временный каталог
+WORKSPACE_MAX_BYTES = 256 * 1024 ** 2    # Задание больше - проверка прямо в каталоге студента
+WORKSPACE_SKIP_DIRS = {".git", "build", "cmake-build-debug", "cmake-build-release"}
+BUILD_JOBS = 0                           # make -j; 0 - доступные ядра, поделенные между студентами
+
+# Кэш сборки (ccache), общий для всех студентов
+BUILD_CACHE_DIR = "/app/.build_cache"
+COMPILER_NAMES = ["gcc", "g++", "cc", "c++", "clang", "clang++"]
+
+# Проверка памяти: "sanitizer" (сборка с -fsanitize, при неудаче - valgrind) или "valgrind"
+DEFAULT_MEMORY_CHECK_ENGINE = "sanitizer"
+SANITIZER_FLAGS = "-fsanitize=address,undefined -fsanitize-recover=address -fno-omit-frame-pointer -g"
+# Косвенные утечки (доступные только через потерянный блок) - как indirectly lost у valgrind,
+# то есть определенные; категории possibly lost у LeakSanitizer нет
+SANITIZER_LEAK_RE = re.compile(r"^(Direct|Indirect) leak of \d+ byte", re.MULTILINE)
+SANITIZER_ERROR_RE = re.compile(r"ERROR: AddressSanitizer|: runtime error: ")
+MEMORY_CHECK_MAX_EXECUTABLES = 3    # Сколько исполняемых файлов задания проверять
+MEMORY_CHECK_JOBS = 3               # Сколько исполняемых файлов проверять одновременно
+# Стандартный ввод проверяемых программ: команда выхода для интерактивных программ,
+# неинтерактивные программы его просто не читают
+DEFAULT_MEMORY_CHECK_INPUT = "off\n"
+VALGRIND_MAX_LOCATIONS = 5          # Сколько мест утечек/ошибок показывать в отчете
+MEMORY_LEAK_LABELS = {
+    "valgrind": ("definitely lost", "possibly lost"),
+    "sanitizer": ("direct/indirect leak", None),
+}
+
+# Параллельный clang-tidy
+CLANG_TIDY_JOBS = 0                  # Потоков clang-tidy на задание; 0 - как у make (BUILD_JOBS)
+COMPILE_SOURCE_SUFFIXES = {".cpp", ".cc", ".cxx", ".c"}
+CLANG_TIDY_DIAGNOSTIC_RE = re.compile(
+    r"^(?P<file>[^:\n]+):(?P<line>\d+):(?P<column>\d+): (?P<kind>warning|error): "
+    r".*?(?:\[(?P<check>[\w.,-]+)\])?$", re.MULTILINE)
+
+# Политика проверки: "full" - все этапы, "early-exit" - дорогие этапы пропускаются,
+# если балл студента уже ниже GRADE_SATISFACTORY, "fast" - дорогие этапы не запускаются
+DEFAULT_GRADING_POLICY = "full"
+GRADING_POLICIES = ["full", "early-exit", "fast"]
+
+# Поиск похожих решений (возможное списывание)
+SIMILARITY_KGRAM = 12              # Длина фрагмента в токенах
+SIMILARITY_WINDOW = 6              # Окно winnowing: совпадение от KGRAM+WINDOW-1 токенов найдется всегда
+SIMILARITY_BANDS = 16              # LSH: полос сигнатуры MinHash
+SIMILARITY_ROWS = 4                # LSH: значений в полосе (длина сигнатуры BANDS * ROWS)
+SIMILARITY_THRESHOLD = 0.7         # Доля общих фрагментов, начиная с которой пара попадает в отчет
+SIMILARITY_COMMON_FRACTION = 0.5   # Фрагменты, которые есть у большей доли студентов, считаются шаблоном
+SIMILARITY_SEED = 2024
+
+# Распределенная проверка через общую очередь (--queue)
+QUEUE_LEASE_SECONDS = 120      # Аренда задачи воркером, продлевается, пока идет проверка
+QUEUE_MAX_ATTEMPTS = 3         # Попыток проверки студента до пометки failed
+QUEUE_POLL_INTERVAL = 2.0      # Период опроса очереди
+QUEUE_IDLE_EXIT_SECONDS = 60   # Воркер завершается, если очередь так долго пуста
+QUEUE_STALL_SECONDS = 600      # Координатор сдается, если воркеры так долго не брали и не продлевали задачи
+
+# Режим наблюдения (--watch)
+WATCH_DEBOUNCE_SECONDS = 2.0   # Пауза после последнего изменения перед перепроверкой
+WATCH_POLL_INTERVAL = 2.0      # Период опроса файлов, если inotify недоступен
+# Изменения только этих файлов (и Makefile) вызывают перепроверку: .txt и .in не учитываются,
+# их пишут сами тесты, и при --no-workspace перепроверка запускала бы следующую
+WATCH_SOURCE_SUFFIXES = {".cpp", ".cc", ".cxx", ".c", ".hpp", ".hh", ".h", ".mk"}
+
+# Загрузка работ из локальных git-зеркал (--git-mirrors)
+GIT_CHECKOUT_DIR = "/app/.submissions"  # Куда извлекаются коммиты студентов
+GIT_INGEST_STATE_DIR = ".ingest"        # Последние проверенные коммиты (в GIT_CHECKOUT_DIR)
+GIT_TIMEOUT_SECONDS = 120               # Таймаут git fetch и git archive
+
+# Метрики и прогресс проверки
+METRICS_HOST = "127.0.0.1"     # Адрес HTTP-сервера метрик по умолчанию (--metrics-host)
+METRICS_STAGE_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]  # Гистограмма времени этапов, сек
+PROGRESS_WINDOW = 20           # По скольким последним студентам считается среднее время для ETA
+
+# cppcheck: инкрементальный анализ с сохранением результатов между запусками
+CPPCHECK_BUILD_DIR = "/app/.cppcheck_cache"  # Каталоги --cppcheck-build-dir для каждого задания (по умолчанию)
+CPPCHECK_JOBS = 0                            # cppcheck -j; 0 - как у make (BUILD_JOBS)
+CPPCHECK_SEVERITIES = ["error", "warning", "performance", "portability", "style"]  # Что считается
+CPPCHECK_MAX_LOCATIONS = 10                  # Сколько диагностик показывать в отчете
+
+# Тесты gtest: запуск шардами параллельно и разбор XML-отчетов
+GTEST_SHARDS = 0                 # Шардов на тестовый бинарник; 0 - как у make (BUILD_JOBS)
+GTEST_MAX_REPORTED_TESTS = 50    # Сколько тестов перечислять в отчете
+GTEST_MARKER = b"gtest_output"   # Строка, по которой исполняемый файл опознается как тест gtest
+
+# Кэш результатов проверки заданий
+CACHE_DIR = "/app/.checker_cache"
+CACHE_MAX_ENTRIES = 1000             # Максимум записей в кэше
+CACHE_MAX_BYTES = 50 * 1024 * 1024   # Максимальный размер кэша
+CACHE_FORMAT_VERSION = 3             # Увеличить при изменении формата записей
+CACHE_SOURCE_SUFFIXES = {".cpp", ".cc", ".cxx", ".c", ".hpp", ".hh", ".h", ".mk", ".txt", ".in"}
+CACHE_SOURCE_NAMES = {"Makefile", "makefile", "GNUmakefile"}
+CACHE_TOOLS = ["make", "g++", "astyle", "cppcheck", "clang-tidy", "valgrind"]
+
 # =============================================================================
 # ШТРАФЫ ЗА РАЗЛИЧНЫЕ НАРУШЕНИЯ
 # =============================================================================
@@ -67,6 +218,46 @@ GRADE_EXCELLENT = 80    # Отлично
 GRADE_GOOD = 60        # Хорошо  
 GRADE_SATISFACTORY = 40 # Удовлетворительно
 
+# =============================================================================
+# СПЕЦИФИКАЦИЯ ЗАДАНИЙ
+# =============================================================================
+
+# Проверяемые задания: этапы (имена из CHECK_REGISTRY) в порядке вывода в отчет и их настройки.
+# Ту же структуру можно передать JSON-файлом через --spec. Необязательные поля:
+#   required_flags      - флаги компилятора, обязательные в Makefile
+#   min_class_files     - минимум файлов классов (этап class_files)
+#   base_class_patterns - регулярные выражения для поиска базового класса (этап class_hierarchy)
+#   memory_check        - "sanitizer" или "valgrind"
+#   memory_input        - стандартный ввод программ при проверке памяти
+#   scale_tests_penalty - штраф за тесты gtest пропорционален доле упавших тестов
+#   penalties           - переопределение штрафов PENALTY_* для задания
+ASSIGNMENT_SPECS = {
+    "Assignment3": {
+        "checks": ["makefile", "build", "class_files", "class_hierarchy", "tests",
+                   "style", "cppcheck", "clang_tidy", "memory"],
+        "min_class_files": MIN_CLASS_FILES_ASSIGNMENT3,
+        "base_class_patterns": [r"class.*Transformer", r"class.*Robot", r"class.*Bot"],
+        "memory_check": "sanitizer",
+        "memory_input": "off\n",
+    },
+    "Assignment4": {
+        "checks": ["makefile", "build", "operators", "tests",
+                   "style", "cppcheck", "clang_tidy", "memory"],
+        "required_flags": ["-Werror", "-Wpedantic", "-Wall"],
+        "memory_check": "sanitizer",
+        "memory_input": "off\n",
+    },
+}
+ASSIGNMENT_SPEC_DEFAULTS = {
+    "required_flags": [],
+    "min_class_files": MIN_CLASS_FILES_ASSIGNMENT3,
+    "base_class_patterns": [],
+    "memory_check": DEFAULT_MEMORY_CHECK_ENGINE,
+    "memory_input": DEFAULT_MEMORY_CHECK_INPUT,
+    "scale_tests_penalty": False,
+    "penalties": {},
+}
+
 # =============================================================================
 # ЦВЕТОВЫЕ КОНСТАНТЫ ДЛЯ ВЫВОДА
 # =============================================================================
@@ -99,43 +290,236 @@ def success(message):
     """Вывод успешного сообщения"""
     print(f"{Colors.GREEN}[SUCCESS]{Colors.NC} {message}")
 
-def find_assignments_folder(student_dir):
-    """Поиск папки с заданиями"""
-    student_path = Path(student_dir)
-    
+def pick_assignments_folder(dir_names):
+    """Папка с заданиями по именам подпапок студента: имя, "" - сама папка студента, или None"""
     # Проверяем известные названия папок
     for name in POSSIBLE_ASSIGNMENT_FOLDER_NAMES:
-        folder_path = student_path / name
-        if folder_path.is_dir():
-            return str(folder_path)
-    
-    for item in student_path.iterdir():
-        if item.is_dir() and "Assignment" in item.name:
-            if any(char.isdigit() for char in item.name):
-                return str(student_path)
-            else:
-                return str(item)
+        if name in dir_names:
+            return name
+    
+    for name in dir_names:
+        if "Assignment" in name:
+            return "" if any(char.isdigit() for char in name) else name
     
     return None
 
-def run_command(command, cwd=None, timeout=None, input_text=None):
-    """Запуск команды с обработкой ошибок"""
+def find_assignments_folder(student_dir):
+    """Поиск папки с заданиями"""
+    student_path = Path(student_dir)
+    folder = pick_assignments_folder([item.name for item in student_path.iterdir() if item.is_dir()])
+    return None if folder is None else str(student_path / folder)
+
+# Список, в который run_command добавляет статистику запусков текущего этапа
+current_command_log = contextvars.ContextVar("current_command_log", default=None)
+
+# Получатель событий о ходе проверки: ProgressMetrics в основном процессе,
+# очередь к нему - в процессах пула; None - события не нужны
+progress_events = None
+
+def set_progress_events(events):
+    global progress_events
+    progress_events = events
+
+def report_progress(*event):
+    """Событие о ходе проверки для метрик: (вид, параметры...)"""
+    if progress_events is not None:
+        progress_events.put(event)
+
+def forward_progress_events(events):
+    """Пересылка событий из очереди процессов пула получателю, до None"""
+    for event in iter(events.get, None):
+        report_progress(*event)
+
+class BoundedOutput:
+    """Вывод процесса с ограничением памяти: хранятся только первые и последние байты"""
+
+    def __init__(self, head_bytes=None, tail_bytes=None):
+        self.head_bytes = SANDBOX_OUTPUT_HEAD_BYTES if head_bytes is None else head_bytes
+        self.tail_bytes = SANDBOX_OUTPUT_TAIL_BYTES if tail_bytes is None else tail_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total = 0
+
+    def feed(self, chunk):
+        self.total += len(chunk)
+        if len(self.head) < self.head_bytes:
+            taken = self.head_bytes - len(self.head)
+            self.head += chunk[:taken]
+            chunk = chunk[taken:]
+        if chunk:
+            self.tail += chunk
+            if len(self.tail) > self.tail_bytes:
+                del self.tail[:len(self.tail) - self.tail_bytes]
+
+    def dropped(self):
+        return self.total - len(self.head) - len(self.tail)
+
+    def text(self):
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.dropped() > 0:
+            return f"{head}\n... [пропущено {self.dropped()} байт вывода] ...\n{tail}"
+        return head + tail
+
+def _read_stream(stream, output, stop):
+    """Чтение потока процесса до конца или до сигнала stop в отдельном потоке"""
+    fd = stream.fileno()
+    poller = select.poll()
+    poller.register(fd, select.POLLIN)
     try:
-        if input_text:
-            result = subprocess.run(
-                command, shell=True, cwd=cwd, timeout=timeout,
-                capture_output=True, text=True, input=input_text
-            )
-        else:
-            result = subprocess.run(
-                command, shell=True, cwd=cwd, timeout=timeout,
-                capture_output=True, text=True
-            )
-        return result.returncode, result.stdout, result.stderr
-    except subprocess.TimeoutExpired:
-        return 124, "", "Timeout expired"
+        while not stop.is_set():
+            if not poller.poll(500):
+                continue
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            output.feed(chunk)
+    finally:
+        stream.close()
+
+def _limit_values(limits):
+    """Ограничения, приведенные к жестким ограничениям текущего процесса (None - не задавать)"""
+    values = {}
+    for name, value in limits.items():
+        if value is None:
+            continue
+        _, hard = resource.getrlimit(SANDBOX_RESOURCES[name])
+        values[name] = value if hard == resource.RLIM_INFINITY else min(value, hard)
+    return values
+
+@functools.lru_cache(maxsize=None)
+def _prlimit_path():
+    return shutil.which("prlimit")
+
+def _sandbox_argv(command, limits):
+    """Аргументы запуска команды: sh -c под prlimit, который задает ограничения и выполняет exec.
+    
+    Ограничения задаются не через preexec_fn: команды запускаются из пулов потоков,
+    а код между fork и exec в многопоточном процессе небезопасен. Без prlimit команда
+    с ограничениями не запускается (FileNotFoundError).
+    """
+    argv = ["/bin/sh", "-c", command]
+    options = [f"{SANDBOX_PRLIMIT_OPTIONS[name]}={value}" for name, value in _limit_values(limits).items()]
+    if not options:
+        return argv
+    if _prlimit_path() is None:
+        raise FileNotFoundError("prlimit (util-linux) не найден, команда не запущена без ограничений ресурсов")
+    return [_prlimit_path(), *options, "--", *argv]
+
+def _kill_group(process):
+    """Завершение всей группы процессов команды, включая внуков (make -> тестовый бинарник)"""
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def run_command(command, cwd=None, timeout=None, input_text=None, env=None, limits=None):
+    """Запуск команды в песочнице с обработкой ошибок; env дополняет текущее окружение.
+    
+    Команда получает ограничения ресурсов limits (по умолчанию SANDBOX_LIMITS, None в
+    значении снимает ограничение) и собственную группу процессов, которая целиком
+    уничтожается по таймауту и после завершения команды. Из вывода сохраняются только
+    начало и конец. Время, процессорное время и пиковая память процесса (по os.wait4)
+    записываются в журнал команд текущего этапа, если он задан.
+    """
+    if env is not None:
+        env = {**os.environ, **env}
+    limits = SANDBOX_LIMITS if limits is None else limits
+    
+    started_at = time.time()
+    started = time.monotonic()
+    timed_out = threading.Event()
+    
+    try:
+        process = subprocess.Popen(
+            _sandbox_argv(command, limits), cwd=cwd, env=env,
+            stdin=subprocess.PIPE if input_text else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True
+        )
     except Exception as e:
         return 1, "", str(e)
+    
+    stdout_output, stderr_output = BoundedOutput(), BoundedOutput()
+    stop_reading = threading.Event()
+    readers = [threading.Thread(target=_read_stream, args=(process.stdout, stdout_output, stop_reading), daemon=True),
+               threading.Thread(target=_read_stream, args=(process.stderr, stderr_output, stop_reading), daemon=True)]
+    for reader in readers:
+        reader.start()
+    
+    def kill():
+        timed_out.set()
+        _kill_group(process)
+    
+    timer = threading.Timer(timeout, kill) if timeout else None
+    if timer is not None:
+        timer.start()
+    
+    try:
+        if input_text:
+            try:
+                process.stdin.write(input_text.encode("utf-8"))
+                process.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+        
+        # wait4 вместо wait, чтобы получить rusage именно этого процесса
+        _, status, usage = os.wait4(process.pid, 0)
+        process.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        # Фоновые потомки не должны переживать команду и держать открытыми ее каналы
+        _kill_group(process)
+    
+    # Процесс, ушедший из группы (setsid, демон), может держать каналы открытыми сколько угодно:
+    # вывод дочитывается ограниченное время, затем каналы закрываются
+    drain_deadline = time.monotonic() + SANDBOX_DRAIN_SECONDS
+    for reader in readers:
+        reader.join(max(0.0, drain_deadline - time.monotonic()))
+    if any(reader.is_alive() for reader in readers):
+        warning(f"Вывод команды {command[:80]} удерживает процесс вне ее группы, чтение прервано")
+        stop_reading.set()
+        for reader in readers:
+            reader.join()
+    
+    command_log = current_command_log.get()
+    if command_log is not None:
+        command_log.append({
+            "command": command[:200],
+            "started_at": started_at,
+            "wall_time": round(time.monotonic() - started, 3),
+            "cpu_time": round(usage.ru_utime + usage.ru_stime, 3),
+            "max_rss_kb": usage.ru_maxrss,
+            "returncode": 124 if timed_out.is_set() else process.returncode,
+            "output_dropped_bytes": stdout_output.dropped() + stderr_output.dropped(),
+        })
+    
+    if timed_out.is_set():
+        return 124, "", "Timeout expired"
+    
+    return process.returncode, stdout_output.text(), stderr_output.text()
+
+def write_json_atomic(path, data):
+    """Запись JSON через временный файл и переименование: файл либо старый, либо новый целиком"""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+def count_changed_lines(before, after):
+    """Количество строк, которые отличаются между двумя версиями текста"""
+    matcher = difflib.SequenceMatcher(None, before.splitlines(), after.splitlines(), autojunk=False)
+    return sum(max(i2 - i1, j2 - j1)
+               for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal')
 
 def check_file_exists(directory, patterns):
     """Проверка существования файлов по паттернам"""
@@ -153,459 +537,2207 @@ def count_files(directory, patterns):
         count += len(list(dir_path.glob(pattern)))
     return count
 
-def search_in_files(directory, pattern, file_patterns):
-    """Поиск паттерна в файлах"""
-    dir_path = Path(directory)
-    for file_pattern in file_patterns:
-        for file_path in dir_path.rglob(file_pattern):
+class SourceIndex:
+    """Исходники задания, прочитанные один раз для всех проверок содержимого"""
+
+    def __init__(self, directory, suffixes=(".h", ".hpp", ".cpp")):
+        self.files = {}
+        for file_path in sorted(Path(directory).rglob("*")):
+            if file_path.suffix not in suffixes or not file_path.is_file():
+                continue
             try:
                 with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    if pattern in content:
-                        return True
-            except:
+                    self.files[file_path] = f.read()
+            except OSError:
                 continue
-    return False
 
-def check_student(student_dir):
-    """Основная функция проверки студента"""
-    student_name = Path(student_dir).name
-    total_score = INITIAL_SCORE
+    def find(self, patterns, suffixes=None, regex=False, first_only=False):
+        """Множество паттернов, найденных хотя бы в одном файле, за один проход по файлам"""
+        remaining = {pattern: re.compile(pattern) if regex else None for pattern in patterns}
+        found = set()
+        
+        for file_path, content in self.files.items():
+            if suffixes and file_path.suffix not in suffixes:
+                continue
+            for pattern, compiled in list(remaining.items()):
+                if compiled.search(content) if compiled else pattern in content:
+                    found.add(pattern)
+                    del remaining[pattern]
+                    if first_only:
+                        return found
+            if not remaining:
+                break
+        
+        return found
+
+    def contains_any(self, patterns, suffixes=None, regex=False):
+        """Встречается ли хотя бы один из паттернов"""
+        return bool(self.find(patterns, suffixes, regex, first_only=True))
+
+# =============================================================================
+# КЭШ РЕЗУЛЬТАТОВ ПРОВЕРКИ
+# =============================================================================
+
+def hash_assignment_sources(assignment_dir, suffixes=None):
+    """Хэш исходников задания: относительные пути и содержимое файлов с суффиксами suffixes
+    (по умолчанию CACHE_SOURCE_SUFFIXES) и Makefile"""
+    assignment_dir = Path(assignment_dir)
+    suffixes = CACHE_SOURCE_SUFFIXES if suffixes is None else suffixes
+    digest = hashlib.sha256()
     
-    log(f"Проверка студента: {student_name}")
+    for file_path in sorted(assignment_dir.rglob("*")):
+        if not file_path.is_file() or ".git" in file_path.relative_to(assignment_dir).parts:
+            continue
+        if file_path.suffix not in suffixes and file_path.name not in CACHE_SOURCE_NAMES:
+            continue
+        digest.update(str(file_path.relative_to(assignment_dir)).encode("utf-8") + b"\0")
+        try:
+            digest.update(file_path.read_bytes())
+        except OSError:
+            continue
+        digest.update(b"\0")
     
-    reports_path = Path(REPORTS_DIR)
-    reports_path.mkdir(parents=True, exist_ok=True)
+    return digest.hexdigest()
+
+@functools.lru_cache(maxsize=None)
+def checker_fingerprint():
+    """Хэш настроек проверки: штрафы, пороги, версии инструментов и код проверяющего скрипта"""
+    digest = hashlib.sha256()
+    digest.update(f"format={CACHE_FORMAT_VERSION}\n".encode("utf-8"))
     
-    report_file = reports_path / f"{student_name}_report.txt"
+    for name, value in sorted(globals().items()):
+        if name.startswith(("PENALTY_", "GRADE_", "MIN_")) or name in ("INITIAL_SCORE", "TIMEOUT_SECONDS"):
+            digest.update(f"{name}={value}\n".encode("utf-8"))
     
-    with open(report_file, 'w', encoding='utf-8') as f:
-        f.write(f"=== ОТЧЕТ ПО ПРОВЕРКЕ СТУДЕНТА: {student_name} ===\n")
-        f.write(f"Начальный балл: {total_score}\n\n")
-        
-        assignments_base_dir = find_assignments_folder(student_dir)
-        
-        if not assignments_base_dir:
-            error(f"Папка с заданиями не найдена у студента {student_name}")
-            f.write("КРИТИЧЕСКАЯ ОШИБКА: Папка с заданиями не найдена\n")
-            f.write("Структура директории студента:\n")
-            
-            for item in Path(student_dir).rglob("*"):
-                if item.is_dir():
-                    f.write(f"{item}\n")
-                    
-            total_score -= PENALTY_NO_ASSIGNMENTS_FOLDER
-            f.write(f"=== ИТОГОВЫЙ БАЛЛ: {total_score}/{INITIAL_SCORE} ===\n")
-            print(f"{student_name}: {total_score}/{INITIAL_SCORE}")
-            return
-        
-        success(f"Найдена папка с заданиями: {assignments_base_dir}")
-        f.write(f"Папка с заданиями: {assignments_base_dir}\n\n")
+    for tool in CACHE_TOOLS:
+        returncode, stdout, stderr = run_command(f"{tool} --version")
+        version = (stdout or stderr).strip().split("\n")[0] if returncode == 0 else "missing"
+        digest.update(f"{tool}={version}\n".encode("utf-8"))
+    
+    try:
+        digest.update(Path(__file__).read_bytes())
+    except OSError:
+        pass
+    
+    return digest.hexdigest()
+
+def effective_spec(spec, options):
+    """Спецификация задания с учетом опций запуска, меняющих результат проверки (для ключей кэша)"""
+    spec = dict(spec)
+    if options.memory_check:
+        spec["memory_check"] = options.memory_check
+    if options.memory_input:
+        # Ввод из файла меняет поведение программ, поэтому в ключ входит его содержимое
+        try:
+            spec["memory_input"] = Path(options.memory_input).read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError):
+            spec["memory_input"] = {"unreadable": options.memory_input}
+    return spec
+
+class ResultCache:
+    """Кэш результатов проверки заданий на диске с вытеснением давно не используемых записей"""
+
+    def __init__(self, cache_dir, max_entries=None, max_bytes=None):
+        self.cache_dir = Path(cache_dir)
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    def key(self, student_name, assignment, assignment_dir, spec=None):
+        """Ключ записи: студент, задание, исходники, спецификация задания и настройки проверки"""
+        digest = hashlib.sha256()
+        digest.update(f"{student_name}/{assignment}".encode("utf-8") + b"\0")
+        digest.update(json.dumps(spec, sort_keys=True).encode("utf-8") + b"\0")
+        digest.update(hash_assignment_sources(assignment_dir).encode("utf-8") + b"\0")
+        digest.update(checker_fingerprint().encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Результат из кэша или None"""
+        entry_path = self.cache_dir / f"{key}.json"
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as cf:
+                entry = json.load(cf)
+            os.utime(entry_path)  # Время последнего использования для вытеснения
+            return entry
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, entry):
+        """Атомарная запись результата в кэш"""
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.cache_dir / f"{key}.json", entry)
+            self.prune()
+        except OSError as e:
+            warning(f"Не удалось сохранить результат в кэш: {e}")
+
+    def prune(self):
+        """Удаление давно не использованных записей сверх лимитов"""
+        entries = []
+        for entry_path in self.cache_dir.glob("*.json"):
+            try:
+                stat = entry_path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry_path))
         
-        # Проверка каждого задания
-        for assignment in ASSIGNMENTS_TO_CHECK:
-            assignment_dir = Path(assignments_base_dir) / assignment
-            f.write(f"--- Проверка {assignment} ---\n")
-            f.write(f"Путь: {assignment_dir}\n")
-            
-            if not assignment_dir.is_dir():
-                error(f"Директория {assignment} не найдена у студента {student_name}")
-                f.write(f"КРИТИЧЕСКАЯ ОШИБКА: Директория {assignment} отсутствует (-{PENALTY_NO_ASSIGNMENT_DIR} баллов)\n")
-                f.write("Доступные папки в {}:\n".format(Path(assignments_base_dir).name))
-                
+        entries.sort(reverse=True)
+        total_bytes = 0
+        for index, (_, size, entry_path) in enumerate(entries):
+            total_bytes += size
+            if index >= self.max_entries or total_bytes > self.max_bytes:
                 try:
-                    for item in Path(assignments_base_dir).iterdir():
-                        f.write(f"{item.name}\n")
-                except:
-                    f.write("Не удается прочитать содержимое\n")
+                    entry_path.unlink()
+                except OSError:
+                    pass
+
+# =============================================================================
+# ЭТАПЫ ПРОВЕРКИ ЗАДАНИЯ
+# =============================================================================
+
+class CheckPlugin:
+    """Зарегистрированный этап проверки.
+    
+    needs_build - этапу нужны результаты сборки: такие этапы выполняются цепочкой после build
+    в порядке спецификации, чтобы make test не пересобирал бинарники, пока их запускает valgrind.
+    deps - другие этапы, которые должны завершиться раньше.
+    cost - относительная стоимость: из готовых к запуску этапов первыми запускаются дешевые.
+    expensive - этап может быть пропущен политикой проверки (--policy, --fast).
+    """
+
+    def __init__(self, name, func, needs_build=False, deps=(), cost=1, expensive=False):
+        self.name = name
+        self.func = func
+        self.needs_build = needs_build
+        self.deps = tuple(deps)
+        self.cost = cost
+        self.expensive = expensive
+
+CHECK_REGISTRY = {}
+
+def register_check(name, needs_build=False, deps=(), cost=1, expensive=False):
+    """Декоратор: регистрация функции этапа под именем, используемым в спецификации заданий"""
+    def decorator(func):
+        CHECK_REGISTRY[name] = CheckPlugin(name, func, needs_build, deps, cost, expensive)
+        return func
+    return decorator
+
+def make_dry_run(directory):
+    """Вывод make --always-make --dry-run в каталоге ("" при ошибке)"""
+    returncode, stdout, _ = run_command("make --always-make --dry-run", cwd=directory, timeout=TIMEOUT_SECONDS)
+    return stdout if returncode == 0 else ""
+
+class AssignmentContext:
+    """Общие данные для всех этапов проверки одного задания"""
+
+    def __init__(self, student_name, assignment, assignment_dir, options, spec=None):
+        self.student_name = student_name
+        self.assignment = assignment
+        self.assignment_dir = Path(assignment_dir)  # Где идет проверка: рабочий каталог или source_dir
+        self.source_dir = Path(assignment_dir)      # Каталог задания у студента
+        self.workspace_root = None                  # Корень рабочих каталогов, если проверка идет в копии
+        self.options = options
+        self.spec = spec if spec is not None else normalize_assignment_spec(assignment, {"checks": []})
+        self.score_before = INITIAL_SCORE  # Балл студента до проверки этого задания
+        self.build_env = None  # Окружение сборки (ccache), заполняется этапом build
+        self._sources = None
+        self._sources_lock = threading.Lock()
+        self._dry_run = None
+        self._dry_run_lock = threading.Lock()
+
+    def penalty(self, name):
+        """Штраф с учетом переопределения в спецификации задания"""
+        return self.spec["penalties"].get(name, globals()[name])
+
+    def forget_directory(self):
+        """Сброс данных, собранных в прежнем каталоге проверки (при переходе из рабочего каталога)"""
+        with self._sources_lock, self._dry_run_lock:
+            self._sources = None
+            self._dry_run = None
+        self.build_env = None
+
+    @property
+    def make_dry_run(self):
+        """Вывод make --always-make --dry-run: все команды сборки без их выполнения"""
+        with self._dry_run_lock:
+            if self._dry_run is None:
+                self._dry_run = make_dry_run(self.assignment_dir)
+            return self._dry_run
+
+    @property
+    def sources(self):
+        """Индекс исходников, строится при первом обращении любого из этапов"""
+        with self._sources_lock:
+            if self._sources is None:
+                self._sources = SourceIndex(self.assignment_dir)
+            return self._sources
+
+class StageResult:
+    """Результат одного этапа: строки отчета и суммарный штраф"""
+
+    def __init__(self, name):
+        self.name = name
+        self.lines = []
+        self.penalty = 0
+        self.aborted = False  # Критическая ошибка: следующие этапы задания не засчитываются
+        self.skipped = False  # Этап не запускался, так как его зависимость не выполнена
+        self.omitted = False  # Этап не запускался по политике проверки
+        self.unavailable = False  # Инструмент для этапа не установлен
+        self.output = ""      # Усеченный вывод инструмента
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.commands = []    # Статистика запусков внешних команд этапа
+        self.details = {}     # Структурированные данные этапа для JSONL (например, результаты тестов)
+
+    def write(self, line):
+        self.lines.append(line)
+
+    def penalize(self, points):
+        self.penalty += points
+
+    def status(self):
+        """Итог этапа для машиночитаемого отчета"""
+        if self.skipped:
+            return "skipped"
+        if self.omitted:
+            return "skipped_by_policy"
+        if self.aborted:
+            return "failed"
+        if self.unavailable:
+            return "unavailable"
+        return "penalized" if self.penalty > 0 else "passed"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "status": self.status(),
+            "penalty": self.penalty,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 3),
+            "cpu_time": round(sum(command["cpu_time"] for command in self.commands), 3),
+            "max_rss_kb": max((command["max_rss_kb"] for command in self.commands), default=0),
+            "commands": self.commands,
+            "lines": self.lines,
+            "details": self.details,
+            "output": self.output[:OUTPUT_EXCERPT_CHARS],
+        }
+
+@register_check("makefile")
+def stage_makefile(ctx, result):
+    """Наличие Makefile и обязательных переменных/флагов"""
+    assignment_dir = ctx.assignment_dir
+    assignment = ctx.assignment
+    
+    # Как в исходной версии: отсутствие Makefile отдельно не штрафуется (проверка через
+    # Path.glob всегда была истинной), задание без Makefile теряет баллы на сборке
+    success("Makefile найден")
+    result.write("OK: Makefile присутствует")
+    
+    makefile_name = None
+    if (assignment_dir / "Makefile").exists():
+        makefile_name = assignment_dir / "Makefile"
+    elif (assignment_dir / "makefile").exists():
+        makefile_name = assignment_dir / "makefile"
+    
+    if makefile_name:
+        try:
+            with open(makefile_name, 'r') as mf:
+                makefile_content = mf.read()
                 
-                total_score -= PENALTY_NO_ASSIGNMENT_DIR
-                continue
+            if not ("CC=" in makefile_content or "CXX=" in makefile_content):
+                warning("В Makefile не найдены переменные компилятора")
+                result.write(f"ПРЕДУПРЕЖДЕНИЕ: Нет переменных компилятора в Makefile (-{ctx.penalty('PENALTY_NO_COMPILER_VARS')} балла)")
+                result.penalize(ctx.penalty("PENALTY_NO_COMPILER_VARS"))
             
-            original_dir = os.getcwd()
-            os.chdir(assignment_dir)
+            if not any(flag in makefile_content for flag in ["CFLAGS", "CXXFLAGS", "CCXFLAGS"]):
+                warning("В Makefile не найдены переменные флагов")
+                result.write(f"ПРЕДУПРЕЖДЕНИЕ: Нет переменных флагов в Makefile (-{ctx.penalty('PENALTY_NO_FLAGS_VARS')} балла)")
+                result.penalize(ctx.penalty("PENALTY_NO_FLAGS_VARS"))
             
-            try:
-                # Проверка Makefile
-                if not (Path(".").glob("Makefile") or Path(".").glob("makefile")):
-                    error(f"Makefile отсутствует в {assignment}")
-                    f.write(f"ОШИБКА: Makefile отсутствует (-{PENALTY_NO_MAKEFILE} баллов)\n")
-                    total_score -= PENALTY_NO_MAKEFILE
-                else:
-                    success("Makefile найден")
-                    f.write("OK: Makefile присутствует\n")
-                
-                makefile_name = None
-                if Path("Makefile").exists():
-                    makefile_name = "Makefile"
-                elif Path("makefile").exists():
-                    makefile_name = "makefile"
-                
-                if makefile_name:
-                    try:
-                        with open(makefile_name, 'r') as mf:
-                            makefile_content = mf.read()
-                            
-                        if not ("CC=" in makefile_content or "CXX=" in makefile_content):
-                            warning("В Makefile не найдены переменные компилятора")
-                            f.write(f"ПРЕДУПРЕЖДЕНИЕ: Нет переменных компилятора в Makefile (-{PENALTY_NO_COMPILER_VARS} балла)\n")
-                            total_score -= PENALTY_NO_COMPILER_VARS
-                        
-                        if not any(flag in makefile_content for flag in ["CFLAGS", "CXXFLAGS", "CCXFLAGS"]):
-                            warning("В Makefile не найдены переменные флагов")
-                            f.write(f"ПРЕДУПРЕЖДЕНИЕ: Нет переменных флагов в Makefile (-{PENALTY_NO_FLAGS_VARS} балла)\n")
-                            total_score -= PENALTY_NO_FLAGS_VARS
-                        
-                        # Специальная проверка для Assignment4
-                        if assignment == "Assignment4":
-                            required_flags = ["-Werror", "-Wpedantic", "-Wall"]
-                            has_all_flags = all(flag in makefile_content for flag in required_flags)
-                            
-                            if not has_all_flags:
-                                error("Отсутствуют обязательные флаги компилятора в Assignment4")
-                                f.write(f"ОШИБКА: Нет флагов -Werror -Wpedantic -Wall в Assignment4 (-{PENALTY_REQUIRED_FLAGS_MISSING} баллов)\n")
-                                total_score -= PENALTY_REQUIRED_FLAGS_MISSING
-                            else:
-                                success("Обязательные флаги -Werror -Wpedantic -Wall найдены в Makefile")
-                                f.write("OK: Найдены обязательные флаги -Werror -Wpedantic -Wall\n")
-                    except:
-                        pass
-                
-                # Сборка проекта
-                log("Попытка сборки проекта...")
-                
-                returncode, _, _ = run_command("make clean")
-                if returncode == 0:
-                    f.write("OK: make clean выполнен успешно\n")
-
-                returncode, stdout, stderr = run_command("make")
-                if returncode == 0:
-                    success("Проект собирается успешно")
-                    f.write("OK: Проект собирается\n")
-                else:
-                    error("Проект не собирается")
-                    f.write(f"КРИТИЧЕСКАЯ ОШИБКА: Проект не собирается (-{PENALTY_BUILD_FAILED} баллов)\n")
-                    f.write("Ошибки сборки:\n")
-                    f.write(stderr[:1000] + "\n")  
-                    total_score -= PENALTY_BUILD_FAILED
-                    continue
-                
-                # Специфичные проверки для Assignment3
-                if assignment == "Assignment3":
-                    cpp_files = count_files(".", ["*.cpp", "*.hpp", "*.h"])
-                    test_files = count_files(".", ["*test*", "*Test*", "*TEST*"])
-                    cpp_files -= test_files
-                    
-                    f.write(f"Найдено файлов исходного кода: {cpp_files}\n")
-                    
-                    if cpp_files < MIN_CLASS_FILES_ASSIGNMENT3:
-                        warning("Недостаточно файлов классов (ожидается минимум 4)")
-                        f.write(f"ПРЕДУПРЕЖДЕНИЕ: Мало файлов классов (-{PENALTY_FEW_CLASS_FILES} балла)\n")
-                        total_score -= PENALTY_FEW_CLASS_FILES
-                    
-                    base_class_patterns = ["class.*Transformer", "class.*Robot", "class.*Bot"]
-                    has_base_class = False
-                    for pattern in base_class_patterns:
-                        if search_in_files(".", pattern, ["*.h", "*.hpp", "*.cpp"]):
-                            has_base_class = True
-                            break
-                    
-                    if not has_base_class:
-                        warning("Не найден базовый класс с подходящим именем")
-                        f.write(f"ПРЕДУПРЕЖДЕНИЕ: Базовый класс не найден (-{PENALTY_NO_BASE_CLASS} балла)\n")
-                        total_score -= PENALTY_NO_BASE_CLASS
-                    
-                    inheritance_patterns = [": public", ": private", ": protected"]
-                    has_inheritance = any(search_in_files(".", pattern, ["*.h", "*.hpp", "*.cpp"]) 
-                                        for pattern in inheritance_patterns)
-                    
-                    if not has_inheritance:
-                        error("Наследование не найдено")
-                        f.write(f"ОШИБКА: Нет наследования классов (-{PENALTY_NO_INHERITANCE} баллов)\n")
-                        total_score -= PENALTY_NO_INHERITANCE
-                
-                # Специфичные проверки для Assignment4
-                if assignment == "Assignment4":
-                    if search_in_files(".", "operator<<", ["*.h", "*.hpp", "*.cpp"]):
-                        success(f"Оператор << найден в {assignment}")
-                        f.write("OK: Оператор << реализован\n")
-                    else:
-                        error(f"Оператор << не найден в {assignment}")
-                        f.write(f"ОШИБКА: Оператор << не реализован (-{PENALTY_NO_STREAM_OPERATOR} баллов)\n")
-                        total_score -= PENALTY_NO_STREAM_OPERATOR
-
-                    comparison_patterns = ["operator<", "operator>", "operator=", "operator!"]
-                    has_comparison = any(search_in_files(".", pattern, ["*.h", "*.hpp", "*.cpp"]) 
-                                       for pattern in comparison_patterns)
-                    
-                    if has_comparison:
-                        success(f"Операторы сравнения найдены в {assignment}")
-                        f.write("OK: Операторы сравнения реализованы\n")
-                    else:
-                        error(f"Операторы сравнения не найдены в {assignment}")
-                        f.write(f"ОШИБКА: Операторы сравнения не реализованы (-{PENALTY_NO_COMPARISON_OPERATORS} баллов)\n")
-                        total_score -= PENALTY_NO_COMPARISON_OPERATORS
-                
-                # Проверка тестов
-                test_files = count_files(".", ["*test*.cpp", "*test*.hpp", "*test*.h", 
-                                             "*Test*.cpp", "*Test*.hpp", "*Test*.h",
-                                             "*TEST*.cpp", "*TEST*.hpp", "*TEST*.h"])
-                
-                if test_files == 0:
-                    error("Тесты не найдены")
-                    f.write(f"ОШИБКА: Тесты отсутствуют (-{PENALTY_NO_TESTS} баллов)\n")
-                    total_score -= PENALTY_NO_TESTS
-                else:
-                    success(f"Тесты найдены ({test_files} файлов)")
-                    f.write(f"OK: Найдено {test_files} файлов тестов\n")
-                    
-                    # Запуск тестов
-                    log("Попытка запуска тестов через 'make test'...")
-                    returncode, stdout, stderr = run_command("make test", timeout=TIMEOUT_SECONDS)
-                    
-                    if returncode == 0:
-                        success("Тесты выполнены успешно")
-                        f.write("OK: Тесты проходят (make test)\n")
-                    else:
-                        warning("Тесты завершились с ошибкой")
-                        f.write(f"ПРЕДУПРЕЖДЕНИЕ: Тесты не проходят (-{PENALTY_TESTS_FAILED} баллов)\n")
-                        f.write("Вывод тестов:\n")
-                        f.write((stdout + stderr)[:500] + "\n")
-                        total_score -= PENALTY_TESTS_FAILED
-                
-                # Проверка стиля с astyle
-                log("Проверка стиля кода...")
-                if subprocess.run(["which", "astyle"], capture_output=True).returncode == 0:
-                    style_issues = 0
-                    style_penalty = 0
-                    
-                    for file_path in Path(".").rglob("*.cpp"):
-                        if file_path.is_file():
-                            with tempfile.NamedTemporaryFile(mode='w', suffix='.cpp', delete=False) as tmp:
-                                tmp_name = tmp.name
-                                subprocess.run(f"cp {file_path} {tmp_name}", shell=True)
-                                
-                            returncode, _, _ = run_command(f"astyle -A1 -s4 --quiet {tmp_name}")
-                            
-                            diff_result = subprocess.run(f"diff -q {file_path} {tmp_name}", 
-                                                       shell=True, capture_output=True)
-                            
-                            if diff_result.returncode != 0:
-                                style_issues += 1
-                                style_penalty += 1
-                            
-                            os.unlink(tmp_name)
-                    
-                    if style_issues > 0:
-                        final_penalty = min(style_penalty // 5, PENALTY_MAX_STYLE_PENALTY)
-                        if final_penalty > 0:
-                            warning(f"Найдены проблемы со стилем кода: {style_issues} файлов")
-                            f.write(f"ПРЕДУПРЕЖДЕНИЕ: Проблемы со стилем кода (-{final_penalty} баллов)\n")
-                            total_score -= final_penalty
-                    else:
-                        success("Стиль кода соответствует astyle")
-                        f.write("OK: Стиль кода соответствует astyle (-A1 -s4)\n")
-                else:
-                    warning("astyle не установлен, пропускаем проверку стиля")
-                    f.write("ПРЕДУПРЕЖДЕНИЕ: astyle не установлен, проверка стиля пропущена\n")
-                
-                # Статический анализ с cppcheck
-                log("Статический анализ кода...")
-                if subprocess.run(["which", "cppcheck"], capture_output=True).returncode == 0:
-                    returncode, stdout, stderr = run_command(
-                        "cppcheck --error-exitcode=1 --enable=warning,style,performance,portability .", 
-                        timeout=TIMEOUT_SECONDS
-                    )
-                    
-                    issues_output = stdout + stderr
-                    cppcheck_issues = len([line for line in issues_output.split('\n') 
-                                         if any(word in line for word in ['error', 'warning', 'style', 'performance', 'portability'])
-                                         and 'Checking' not in line])
-                    
-                    if cppcheck_issues > 0:
-                        warning(f"Найдены предупреждения статического анализа: {cppcheck_issues}")
-                        f.write(f"ПРЕДУПРЕЖДЕНИЕ: Предупреждения cppcheck (-{PENALTY_CPPCHECK_ISSUES} балла)\n")
-                        f.write(f"Детали cppcheck:\n{issues_output[:500]}\n")
-                        total_score -= PENALTY_CPPCHECK_ISSUES
-                    else:
-                        success("Статический анализ пройден без предупреждений")
-                        f.write("OK: Статический анализ cppcheck пройден\n")
-                else:
-                    warning("cppcheck не установлен, пропускаем статический анализ")
-                    f.write("ПРЕДУПРЕЖДЕНИЕ: cppcheck не установлен, статический анализ пропущен\n")
-                
-                # Проверка clang-tidy
-                log("Проверка clang-tidy...")
-                if subprocess.run(["which", "clang-tidy"], capture_output=True).returncode == 0:
-                    clang_tidy_issues = 0
-                    
-                    cpp_files = list(Path(".").glob("*.cpp"))[:5] 
-                    
-                    for cpp_file in cpp_files:
-                        returncode, stdout, stderr = run_command(
-                            f"clang-tidy {cpp_file} -- -std=c++17", 
-                            timeout=TIMEOUT_SECONDS
-                        )
-                        
-                        issues_output = stdout + stderr
-                        if any(word in issues_output for word in ['warning:', 'error:']):
-                            clang_tidy_issues += 1
-                    
-                    if clang_tidy_issues > 0:
-                        penalty = min(clang_tidy_issues, PENALTY_MAX_CLANG_TIDY)
-                        warning(f"Найдены предупреждения clang-tidy: {clang_tidy_issues} файлов")
-                        f.write(f"ПРЕДУПРЕЖДЕНИЕ: Предупреждения clang-tidy (-{penalty} баллов)\n")
-                        total_score -= penalty
-                    else:
-                        success("clang-tidy проверка пройдена без предупреждений")
-                        f.write("OK: clang-tidy проверка пройдена\n")
-                else:
-                    warning("clang-tidy не установлен, пропускаем проверку")
-                    f.write("ПРЕДУПРЕЖДЕНИЕ: clang-tidy не установлен, проверка пропущена\n")
+            # Обязательные флаги из спецификации задания
+            required_flags = ctx.spec["required_flags"]
+            if required_flags:
+                flags = " ".join(required_flags)
+                has_all_flags = all(flag in makefile_content for flag in required_flags)
                 
-                # Проверка утечек памяти с valgrind
-                log("Проверка утечек памяти...")
-                executable_files = []
-                for item in Path(".").iterdir():
-                    if item.is_file() and os.access(item, os.X_OK) and not item.suffix:
-                        executable_files.append(str(item))
-                
-                executable_files = executable_files[:3]
-                f.write(f"Найдены исполняемые файлы: {executable_files}\n")
-                
-                if not executable_files:
-                    warning(f"Исполняемые файлы не найдены для проверки утечек памяти в {assignment}")
-                    f.write("ПРЕДУПРЕЖДЕНИЕ: Исполняемые файлы не найдены, проверка утечек памяти пропущена\n")
+                if not has_all_flags:
+                    error(f"Отсутствуют обязательные флаги компилятора в {assignment}")
+                    result.write(f"ОШИБКА: Нет флагов {flags} в {assignment} (-{ctx.penalty('PENALTY_REQUIRED_FLAGS_MISSING')} баллов)")
+                    result.penalize(ctx.penalty("PENALTY_REQUIRED_FLAGS_MISSING"))
                 else:
-                    if subprocess.run(["which", "valgrind"], capture_output=True).returncode == 0:
-                        for exe in executable_files:
-                            if Path(exe).is_file():
-                                is_interactive = search_in_files(".", "std::cin", ["*.cpp"]) or \
-                                               search_in_files(".", "Write your command", ["*.cpp"])
-                                
-                                if is_interactive:
-                                    log(f"Обнаружен интерактивный ввод в {assignment}, использование команды 'off' для {exe}")
-                                    returncode, stdout, stderr = run_command(
-                                        f"valgrind --tool=memcheck --leak-check=full --error-exitcode=1 {exe}",
-                                        timeout=TIMEOUT_SECONDS, input_text="off\n"
-                                    )
-                                else:
-                                    returncode, stdout, stderr = run_command(
-                                        f"valgrind --tool=memcheck --leak-check=full --error-exitcode=1 {exe}",
-                                        timeout=TIMEOUT_SECONDS
-                                    )
-                                
-                                valgrind_output = stdout + stderr
-                                
-                                if returncode == 124:  # Timeout
-                                    warning(f"Исполняемый файл {exe} превысил таймаут valgrind в {assignment}")
-                                    f.write(f"ПРЕДУПРЕЖДЕНИЕ: Исполняемый файл {Path(exe).name} превысил таймаут valgrind ({TIMEOUT_SECONDS} секунд) (-{PENALTY_VALGRIND_TIMEOUT} балл)\n")
-                                    total_score -= PENALTY_VALGRIND_TIMEOUT
-                                elif "definitely lost" in valgrind_output and any(char.isdigit() for char in valgrind_output.split("definitely lost")[1].split()[0] if "definitely lost" in valgrind_output):
-                                    warning(f"Обнаружены утечки памяти (definitely lost) в {exe} в {assignment}")
-                                    f.write(f"ПРЕДУПРЕЖДЕНИЕ: Утечки памяти (definitely lost) в {Path(exe).name} (-{PENALTY_MEMORY_LEAKS_DEFINITE} балла)\n")
-                                    total_score -= PENALTY_MEMORY_LEAKS_DEFINITE
-                                elif "possibly lost" in valgrind_output:
-                                    warning(f"Обнаружены возможные утечки памяти (possibly lost) в {exe} в {assignment}")
-                                    f.write(f"ПРЕДУПРЕЖДЕНИЕ: Возможные утечки памяти (possibly lost) в {Path(exe).name} (-{PENALTY_MEMORY_LEAKS_POSSIBLE} балл)\n")
-                                    total_score -= PENALTY_MEMORY_LEAKS_POSSIBLE
-                                elif "ERROR SUMMARY:" in valgrind_output and any(char.isdigit() and char != '0' for char in valgrind_output.split("ERROR SUMMARY:")[1].split()[0] if "ERROR SUMMARY:" in valgrind_output):
-                                    warning(f"Обнаружены ошибки памяти в {exe} в {assignment}")
-                                    f.write(f"ПРЕДУПРЕЖДЕНИЕ: Ошибки памяти в {Path(exe).name} (-{PENALTY_MEMORY_ERRORS} балла)\n")
-                                    total_score -= PENALTY_MEMORY_ERRORS
-                                else:
-                                    success(f"Утечки памяти не обнаружены в {exe} в {assignment}")
-                                    f.write(f"OK: Утечки памяти не обнаружены в {Path(exe).name}\n")
-                    else:
-                        warning(f"valgrind не установлен, пропускаем проверку утечек памяти в {assignment}")
-                        f.write("ПРЕДУПРЕЖДЕНИЕ: valgrind не установлен, проверка утечек памяти пропущена\n")
-                
-            finally:
-                os.chdir(original_dir)
-            
-            f.write("\n")
-        
-        # Итоговая оценка
-        f.write(f"=== ИТОГОВЫЙ БАЛЛ: {total_score}/{INITIAL_SCORE} ===\n")
+                    success(f"Обязательные флаги {flags} найдены в Makefile")
+                    result.write(f"OK: Найдены обязательные флаги {flags}")
+        except:
+            pass
+
+def ccache_environment(build_cache_dir, base_dir=None):
+    """Окружение, в котором компиляторы из Makefile студента вызываются через ccache"""
+    ccache_path = shutil.which("ccache")
+    if not ccache_path:
+        return None
+    
+    # Симлинки с именами компиляторов: ccache сам найдет настоящий компилятор в PATH,
+    # а переменные CC/CXX из Makefile студента остаются без изменений
+    bin_dir = Path(build_cache_dir) / "bin"
+    bin_dir.mkdir(parents=True, exist_ok=True)
+    for compiler in COMPILER_NAMES:
+        link = bin_dir / compiler
+        if not link.exists():
+            try:
+                link.symlink_to(ccache_path)
+            except FileExistsError:
+                pass
+    
+    return {
+        "PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}",
+        "CCACHE_DIR": str(Path(build_cache_dir) / "ccache"),
+        # Пути относительно каталога студентов (или рабочих каталогов), чтобы кэш был общим
+        "CCACHE_BASEDIR": str(Path(base_dir or STUDENTS_DIR).resolve()),
+        "CCACHE_NOHASHDIR": "1",
+    }
+
+def read_ccache_stats(stats_log):
+    """Число попаданий и промахов ccache по журналу статистики одной сборки"""
+    hits = misses = 0
+    try:
+        with open(stats_log, 'r', encoding='utf-8', errors='ignore') as sf:
+            for line in sf:
+                line = line.strip()
+                if line.endswith("cache_hit"):
+                    hits += 1
+                elif line == "cache_miss":
+                    misses += 1
+    except OSError:
+        pass
+    return hits, misses
+
+def build_jobs(options):
+    """Число параллельных заданий make: доступные ядра, поделенные между студентами"""
+    if BUILD_JOBS:
+        return BUILD_JOBS
+    return max(1, len(os.sched_getaffinity(0)) // max(1, options.jobs))
+
+@register_check("build", cost=10)
+def stage_build(ctx, result):
+    """Сборка проекта; при ошибке остальные этапы задания не засчитываются"""
+    log("Попытка сборки проекта...")
+    
+    build_env = None
+    stats_log = None
+    source_hash = None
+    state_file = None
+    
+    if ctx.options.build_cache:
+        build_cache_dir = Path(ctx.options.build_cache_dir)
+        ctx.build_env = ccache_environment(build_cache_dir, ctx.workspace_root)
+        if ctx.build_env is None:
+            warning("ccache не установлен, сборка без кэша компиляции")
+        else:
+            fd, stats_log = tempfile.mkstemp(prefix="ccache_stats_", suffix=".log")
+            os.close(fd)
+            build_env = {**ctx.build_env, "CCACHE_STATSLOG": stats_log}
         
-        if total_score >= GRADE_EXCELLENT:
-            success(f"Студент {student_name}: {total_score}/{INITIAL_SCORE} баллов (Отлично)")
-        elif total_score >= GRADE_GOOD:
-            warning(f"Студент {student_name}: {total_score}/{INITIAL_SCORE} баллов (Хорошо)")
-        elif total_score >= GRADE_SATISFACTORY:
-            warning(f"Студент {student_name}: {total_score}/{INITIAL_SCORE} баллов (Удовлетворительно)")
+        # В свежей копии задания собирать заново нужно всегда, make clean пропускается только на месте
+        if ctx.workspace_root is None:
+            source_hash = hash_assignment_sources(ctx.assignment_dir)
+            state_file = build_cache_dir / "state" / f"{ctx.student_name}_{ctx.assignment}.sha256"
+    
+    try:
+        if state_file is not None and state_file.exists() and state_file.read_text().strip() == source_hash:
+            log("Исходники не изменились, make clean пропущен")
+            result.write("OK: Исходники не изменились с прошлой сборки, make clean пропущен")
         else:
-            error(f"Студент {student_name}: {total_score}/{INITIAL_SCORE} баллов (Неудовлетворительно)")
+            returncode, _, _ = run_command("make clean", cwd=ctx.assignment_dir, env=build_env)
+            if returncode == 0:
+                result.write("OK: make clean выполнен успешно")
+
+        jobs = build_jobs(ctx.options)
+        returncode, stdout, stderr = run_command(f"make -j{jobs}", cwd=ctx.assignment_dir, env=build_env)
+        if returncode != 0 and jobs > 1:
+            # Makefile с неполными зависимостями может не собираться параллельно
+            returncode, stdout, stderr = run_command("make", cwd=ctx.assignment_dir, env=build_env)
+            if returncode == 0:
+                warning("Параллельная сборка не удалась, проект собран последовательно")
+                result.write(f"ПРЕДУПРЕЖДЕНИЕ: make -j{jobs} не удался, проект собран последовательно "
+                             "(неполные зависимости в Makefile)")
         
-        print(f"{student_name}: {total_score}/{INITIAL_SCORE}")
-        return total_score
+        if stats_log is not None:
+            hits, misses = read_ccache_stats(stats_log)
+            result.write(f"ccache: попаданий {hits}, промахов {misses}")
+    finally:
+        if stats_log is not None:
+            os.unlink(stats_log)
+    
+    if returncode != 0 and ctx.workspace_root is not None and "No space left on device" in stdout + stderr:
+        raise WorkspaceFull(f"в {ctx.workspace_root} не хватило места для сборки")
+    
+    if returncode == 0:
+        success("Проект собирается успешно")
+        result.write("OK: Проект собирается")
+        if state_file is not None:
+            state_file.parent.mkdir(parents=True, exist_ok=True)
+            state_file.write_text(source_hash)
+    else:
+        error("Проект не собирается")
+        result.write(f"КРИТИЧЕСКАЯ ОШИБКА: Проект не собирается (-{ctx.penalty('PENALTY_BUILD_FAILED')} баллов)")
+        result.write("Ошибки сборки:")
+        result.write(stderr[:1000])
+        result.output = stderr
+        result.penalize(ctx.penalty("PENALTY_BUILD_FAILED"))
+        result.aborted = True
+        if state_file is not None and state_file.exists():
+            state_file.unlink()
 
-def main():
-    """Основная функция"""
-    log("Начало проверки домашних заданий")
+@register_check("class_files", needs_build=True)
+def stage_class_files(ctx, result):
+    """Количество файлов классов"""
+    # Считаются все файлы с "test" в имени, включая собранные бинарники,
+    # поэтому этап выполняется после сборки
+    cpp_files = count_files(ctx.assignment_dir, ["*.cpp", "*.hpp", "*.h"])
+    test_files = count_files(ctx.assignment_dir, ["*test*", "*Test*", "*TEST*"])
+    cpp_files -= test_files
+    
+    result.write(f"Найдено файлов исходного кода: {cpp_files}")
+    
+    min_class_files = ctx.spec["min_class_files"]
+    if cpp_files < min_class_files:
+        warning(f"Недостаточно файлов классов (ожидается минимум {min_class_files})")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Мало файлов классов (-{ctx.penalty('PENALTY_FEW_CLASS_FILES')} балла)")
+        result.penalize(ctx.penalty("PENALTY_FEW_CLASS_FILES"))
 
-    script_dir = Path(__file__).parent.absolute()
-    os.chdir(script_dir)
+@register_check("class_hierarchy")
+def stage_class_hierarchy(ctx, result):
+    """Базовый класс и наследование"""
+    base_class_patterns = ctx.spec["base_class_patterns"]
+    has_base_class = ctx.sources.contains_any(base_class_patterns, regex=True)
+    
+    if base_class_patterns and not has_base_class:
+        warning("Не найден базовый класс с подходящим именем")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Базовый класс не найден (-{ctx.penalty('PENALTY_NO_BASE_CLASS')} балла)")
+        result.penalize(ctx.penalty("PENALTY_NO_BASE_CLASS"))
+    
+    inheritance_patterns = [": public", ": private", ": protected"]
+    has_inheritance = ctx.sources.contains_any(inheritance_patterns)
+    
+    if not has_inheritance:
+        error("Наследование не найдено")
+        result.write(f"ОШИБКА: Нет наследования классов (-{ctx.penalty('PENALTY_NO_INHERITANCE')} баллов)")
+        result.penalize(ctx.penalty("PENALTY_NO_INHERITANCE"))
 
-    reports_path = Path(REPORTS_DIR)
-    reports_path.mkdir(parents=True, exist_ok=True)
+@register_check("operators")
+def stage_operators(ctx, result):
+    """Оператор вывода и операторы сравнения"""
+    assignment = ctx.assignment
     
-    summary_report = reports_path / "summary_report.txt"
+    comparison_patterns = ["operator<", "operator>", "operator=", "operator!"]
+    found = ctx.sources.find(["operator<<"] + comparison_patterns)
     
-    with open(summary_report, 'w', encoding='utf-8') as f:
-        f.write("=== СВОДНЫЙ ОТЧЕТ ПО ВСЕМ СТУДЕНТАМ ===\n")
-        f.write(f"Дата проверки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Рабочая директория: {os.getcwd()}\n")
-        f.write(f"Проверяемые задания: {', '.join(ASSIGNMENTS_TO_CHECK)}\n")
-        f.write("\n")
-        
-        total_students = 0
-        passed_students = 0
-        all_scores = []
-        
-        log("Поиск папок студентов...")
-        student_dirs = []
-        app_path = Path("/app")
-        if app_path.exists():
-            for item in app_path.iterdir():
-                if item.is_dir() and item.name.startswith("student"):
-                    student_dirs.append(item)
-        
-        student_dirs.sort(key=lambda x: x.name)
+    if "operator<<" in found:
+        success(f"Оператор << найден в {assignment}")
+        result.write("OK: Оператор << реализован")
+    else:
+        error(f"Оператор << не найден в {assignment}")
+        result.write(f"ОШИБКА: Оператор << не реализован (-{ctx.penalty('PENALTY_NO_STREAM_OPERATOR')} баллов)")
+        result.penalize(ctx.penalty("PENALTY_NO_STREAM_OPERATOR"))
+
+    has_comparison = any(pattern in found for pattern in comparison_patterns)
+    
+    if has_comparison:
+        success(f"Операторы сравнения найдены в {assignment}")
+        result.write("OK: Операторы сравнения реализованы")
+    else:
+        error(f"Операторы сравнения не найдены в {assignment}")
+        result.write(f"ОШИБКА: Операторы сравнения не реализованы (-{ctx.penalty('PENALTY_NO_COMPARISON_OPERATORS')} баллов)")
+        result.penalize(ctx.penalty("PENALTY_NO_COMPARISON_OPERATORS"))
+
+def is_gtest_binary(path):
+    """Собран ли исполняемый файл с Google Test"""
+    try:
+        return GTEST_MARKER in Path(path).read_bytes()
+    except OSError:
+        return False
+
+def find_gtest_binaries(ctx):
+    """Тестовые бинарники gtest среди исполняемых файлов, которые собирает Makefile"""
+    executables = (find_makefile_executables(ctx.assignment_dir, ctx.make_dry_run)
+                   or find_executables(ctx.assignment_dir))
+    return [exe for exe in executables if is_gtest_binary(ctx.assignment_dir / exe)]
+
+def parse_gtest_xml(xml_path):
+    """Результаты тестов из XML-отчета gtest: [{name, status, time, message}] или None"""
+    try:
+        root = ElementTree.parse(xml_path).getroot()
+    except (OSError, ElementTree.ParseError):
+        return None
+    
+    tests = []
+    for testcase in root.iter("testcase"):
+        failure = testcase.find("failure")
+        if failure is not None:
+            status = "failed"
+        elif (testcase.get("result") == "skipped" or testcase.get("status") == "notrun"
+              or testcase.find("skipped") is not None):
+            status = "skipped"
+        else:
+            status = "passed"
+        tests.append({
+            "name": f"{testcase.get('classname', '')}.{testcase.get('name', '')}",
+            "status": status,
+            "time": float(testcase.get("time") or 0),
+            "message": " ".join((failure.get("message") or "").split())[:200] if failure is not None else "",
+        })
+    return tests
+
+def run_gtest_shards(ctx, result, binaries):
+    """Запуск тестов gtest шардами; True, если все шарды завершились вовремя и без ошибок"""
+    shards = GTEST_SHARDS or build_jobs(ctx.options)
+    runs = [(exe, index) for exe in binaries for index in range(shards)]
+    
+    with tempfile.TemporaryDirectory(prefix="gtest_") as report_dir:
+        def run_shard(run):
+            exe, index = run
+            xml_path = Path(report_dir) / f"{exe}.{index}.xml"
+            env = {"GTEST_TOTAL_SHARDS": str(shards), "GTEST_SHARD_INDEX": str(index)}
+            returncode, stdout, stderr = run_command(
+                f"./{exe} --gtest_output=xml:{shlex.quote(str(xml_path))}",
+                cwd=ctx.assignment_dir, timeout=TIMEOUT_SECONDS, env=env)
+            return exe, index, returncode, stdout + stderr, parse_gtest_xml(xml_path)
         
-        for student_dir in student_dirs:
-            student_name = student_dir.name
-            log(f"Найден студент: {student_name}")
-            total_students += 1
-            
-            try:
-                score = check_student(str(student_dir))
-                all_scores.append(score)
-                
-                f.write(f"{student_name}: {score} баллов\n")
-                
-                if score >= GRADE_SATISFACTORY:
-                    passed_students += 1
-                    
-            except Exception as e:
-                error(f"Ошибка при проверке студента {student_name}: {e}")
-                f.write(f"{student_name}: ОШИБКА ПРОВЕРКИ\n")
-                all_scores.append(0)
+        shard_results = map_in_stage(run_shard, runs, shards)
+    
+    tests = []
+    broken_shards = []
+    for exe, index, returncode, output, shard_tests in shard_results:
+        if returncode == 124 or shard_tests is None:
+            reason = f"превышен таймаут ({TIMEOUT_SECONDS} секунд)" if returncode == 124 else "нет XML-отчета"
+            broken_shards.append(f"{exe} (шард {index + 1}/{shards}): {reason}")
+            result.output += output
+            continue
+        tests += [{**test, "binary": exe} for test in shard_tests]
+        if returncode != 0 and not any(test["status"] == "failed" for test in shard_tests):
+            broken_shards.append(f"{exe} (шард {index + 1}/{shards}): код возврата {returncode}")
+            result.output += output
+    
+    tests.sort(key=lambda test: (test["binary"], test["name"]))
+    failed = [test for test in tests if test["status"] == "failed"]
+    passed = sum(1 for test in tests if test["status"] == "passed")
+    result.details["tests"] = tests
+    result.details["shards"] = shards
+    
+    result.write(f"Тесты gtest ({', '.join(binaries)}, шардов: {shards}): пройдено {passed} из {len(tests)}, "
+                 f"упало {len(failed)}, время {sum(test['time'] for test in tests):.2f} сек")
+    for test in tests[:GTEST_MAX_REPORTED_TESTS]:
+        line = f"  [{test['status']}] {test['name']} ({test['time']:.3f} сек)"
+        if test["message"]:
+            line += f": {test['message']}"
+        result.write(line)
+    if len(tests) > GTEST_MAX_REPORTED_TESTS:
+        result.write(f"  ... и еще {len(tests) - GTEST_MAX_REPORTED_TESTS}")
+    for shard in broken_shards:
+        result.write(f"  Ошибка запуска: {shard}")
+    
+    if not failed and not broken_shards:
+        success(f"Тесты gtest выполнены успешно ({passed})")
+        result.write("OK: Тесты проходят (gtest)")
+        return
+    
+    warning(f"Тесты gtest не проходят: упало {len(failed)}, ошибок запуска {len(broken_shards)}")
+    penalty = ctx.penalty("PENALTY_TESTS_FAILED")
+    if ctx.spec["scale_tests_penalty"] and tests and not broken_shards:
+        penalty = math.ceil(penalty * len(failed) / len(tests))
+    result.write(f"ПРЕДУПРЕЖДЕНИЕ: Тесты не проходят (-{penalty} баллов)")
+    result.penalize(penalty)
+
+@register_check("tests", needs_build=True, cost=10)
+def stage_tests(ctx, result):
+    """Наличие тестов и их запуск: gtest - шардами с разбором XML, иначе make test"""
+    test_files = count_files(ctx.assignment_dir, ["*test*.cpp", "*test*.hpp", "*test*.h", 
+                                                  "*Test*.cpp", "*Test*.hpp", "*Test*.h",
+                                                  "*TEST*.cpp", "*TEST*.hpp", "*TEST*.h"])
+    
+    if test_files == 0:
+        error("Тесты не найдены")
+        result.write(f"ОШИБКА: Тесты отсутствуют (-{ctx.penalty('PENALTY_NO_TESTS')} баллов)")
+        result.penalize(ctx.penalty("PENALTY_NO_TESTS"))
+        return
+    
+    success(f"Тесты найдены ({test_files} файлов)")
+    result.write(f"OK: Найдено {test_files} файлов тестов")
+    
+    gtest_binaries = find_gtest_binaries(ctx)
+    if gtest_binaries:
+        log(f"Запуск тестов gtest: {', '.join(gtest_binaries)}")
+        run_gtest_shards(ctx, result, gtest_binaries)
+        return
+    
+    # Запуск тестов
+    log("Попытка запуска тестов через 'make test'...")
+    returncode, stdout, stderr = run_command("make test", cwd=ctx.assignment_dir, timeout=TIMEOUT_SECONDS,
+                                             env=ctx.build_env)
+    
+    if returncode == 0:
+        success("Тесты выполнены успешно")
+        result.write("OK: Тесты проходят (make test)")
+    else:
+        warning("Тесты завершились с ошибкой")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Тесты не проходят (-{ctx.penalty('PENALTY_TESTS_FAILED')} баллов)")
+        result.write("Вывод тестов:")
+        result.write((stdout + stderr)[:500])
+        result.output = stdout + stderr
+        result.penalize(ctx.penalty("PENALTY_TESTS_FAILED"))
+
+@register_check("style", cost=3)
+def stage_style(ctx, result):
+    """Проверка стиля с astyle: все файлы форматируются одним запуском во временной копии"""
+    log("Проверка стиля кода...")
+    if subprocess.run(["which", "astyle"], capture_output=True).returncode != 0:
+        warning("astyle не установлен, пропускаем проверку стиля")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: astyle не установлен, проверка стиля пропущена")
+        result.unavailable = True
+        return
+    
+    sources = {file_path.relative_to(ctx.assignment_dir): content
+               for file_path, content in ctx.sources.files.items()}
+    changed_lines = {}
+    
+    with tempfile.TemporaryDirectory(prefix="astyle_") as mirror_dir:
+        for relative_path, content in sources.items():
+            mirror_path = Path(mirror_dir) / relative_path
+            mirror_path.parent.mkdir(parents=True, exist_ok=True)
+            mirror_path.write_text(content, encoding='utf-8')
         
-        f.write("\n")
-        f.write("Общая статистика:\n")
-        f.write(f"Всего студентов: {total_students}\n")
-        f.write(f"Прошли (>={GRADE_SATISFACTORY} баллов): {passed_students}\n")
+        if sources:
+            file_args = " ".join(shlex.quote(str(relative_path)) for relative_path in sources)
+            returncode, _, stderr = run_command(f"astyle -A1 -s4 --quiet --suffix=none {file_args}",
+                                                cwd=mirror_dir, timeout=TIMEOUT_SECONDS)
+            if returncode != 0:
+                warning("astyle завершился с ошибкой, пропускаем проверку стиля")
+                result.write("ПРЕДУПРЕЖДЕНИЕ: astyle завершился с ошибкой, проверка стиля пропущена")
+                result.write(stderr[:500])
+                result.output = stderr
+                return
         
-        if total_students > 0:
-            success_rate = (passed_students * 100) // total_students
-            f.write(f"Процент успешности: {success_rate}%\n")
-            
-            if all_scores:
-                avg_score = sum(all_scores) // len(all_scores)
-                f.write(f"Средний балл: {avg_score}\n")
-                f.write(f"Максимальный балл: {max(all_scores)}\n")
-                f.write(f"Минимальный балл: {min(all_scores)}\n")
+        for relative_path, content in sources.items():
+            formatted = (Path(mirror_dir) / relative_path).read_text(encoding='utf-8', errors='ignore')
+            changed = count_changed_lines(content, formatted)
+            if changed:
+                changed_lines[relative_path] = changed
+    
+    style_issues = len(changed_lines)
+    
+    if style_issues > 0:
+        final_penalty = min(style_issues // 5, ctx.penalty("PENALTY_MAX_STYLE_PENALTY"))
+        if final_penalty > 0:
+            warning(f"Найдены проблемы со стилем кода: {style_issues} файлов")
+            result.write(f"ПРЕДУПРЕЖДЕНИЕ: Проблемы со стилем кода (-{final_penalty} баллов)")
+        result.write(f"Файлы, не соответствующие astyle (-A1 -s4): {style_issues}")
+        for relative_path in sorted(changed_lines):
+            result.write(f"  {relative_path}: {changed_lines[relative_path]} строк")
+        result.penalize(final_penalty)
+    else:
+        success("Стиль кода соответствует astyle")
+        result.write("OK: Стиль кода соответствует astyle (-A1 -s4)")
+
+def parse_cppcheck_xml(xml_path):
+    """Диагностики из XML-отчета cppcheck (--xml-version=2): [(severity, id, file, line, msg)] или None"""
+    diagnostics = set()
+    try:
+        for _, element in ElementTree.iterparse(xml_path):
+            if element.tag != "error":
+                continue
+            severity = element.get("severity")
+            if severity in CPPCHECK_SEVERITIES:
+                location = element.find("location")
+                file_name = location.get("file") if location is not None else element.get("file0", "")
+                line = int(location.get("line", 0)) if location is not None else 0
+                # Одна и та же диагностика в заголовке приходит из каждой единицы трансляции
+                diagnostics.add((severity, element.get("id", ""), file_name, line, element.get("msg", "")))
+            element.clear()
+    except (OSError, ElementTree.ParseError):
+        return None
+    return sorted(diagnostics, key=lambda item: (CPPCHECK_SEVERITIES.index(item[0]), item[2], item[3]))
+
+@register_check("cppcheck", cost=5)
+def stage_cppcheck(ctx, result):
+    """Статический анализ с cppcheck: параллельно, инкрементально, с разбором XML-отчета"""
+    log("Статический анализ кода...")
+    if subprocess.run(["which", "cppcheck"], capture_output=True).returncode != 0:
+        warning("cppcheck не установлен, пропускаем статический анализ")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: cppcheck не установлен, статический анализ пропущен")
+        result.unavailable = True
+        return
+    
+    # Результаты анализа неизменившихся файлов cppcheck берет из каталога прошлого запуска
+    build_dir = Path(ctx.options.cppcheck_build_dir) / f"{ctx.student_name}_{ctx.assignment}"
+    try:
+        build_dir.mkdir(parents=True, exist_ok=True)
+        build_dir_option = f"--cppcheck-build-dir={shlex.quote(str(build_dir))} "
+    except OSError as e:
+        warning(f"Каталог {build_dir} недоступен ({e}), cppcheck анализирует все файлы заново")
+        build_dir_option = ""
+    jobs = CPPCHECK_JOBS or build_jobs(ctx.options)
+    
+    with tempfile.TemporaryDirectory(prefix="cppcheck_") as report_dir:
+        xml_path = Path(report_dir) / "cppcheck.xml"
+        returncode, stdout, stderr = run_command(
+            f"cppcheck -j {jobs} {build_dir_option}"
+            f"--enable=warning,style,performance,portability --quiet "
+            f"--xml --xml-version=2 --output-file={shlex.quote(str(xml_path))} .",
+            cwd=ctx.assignment_dir, timeout=TIMEOUT_SECONDS
+        )
+        diagnostics = parse_cppcheck_xml(xml_path)
+        if diagnostics is not None:
+            result.output = xml_path.read_text(encoding="utf-8", errors="replace")
+    
+    if returncode == 124:
+        warning("cppcheck превысил таймаут")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: cppcheck превысил таймаут ({TIMEOUT_SECONDS} секунд), анализ не засчитан")
+        return
+    if diagnostics is None:
+        warning("cppcheck не создал отчет")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: cppcheck завершился без отчета, анализ не засчитан")
+        result.output = stdout + stderr
+        return
+    
+    counts = {severity: 0 for severity in CPPCHECK_SEVERITIES}
+    for severity, *_ in diagnostics:
+        counts[severity] += 1
+    result.write("cppcheck: " + ", ".join(f"{severity}: {count}" for severity, count in counts.items()))
+    
+    if diagnostics:
+        warning(f"Найдены предупреждения статического анализа: {len(diagnostics)}")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Предупреждения cppcheck (-{ctx.penalty('PENALTY_CPPCHECK_ISSUES')} балла)")
+        for severity, check_id, file_name, line, message in diagnostics[:CPPCHECK_MAX_LOCATIONS]:
+            result.write(f"  {file_name}:{line}: [{severity}] {message} ({check_id})")
+        if len(diagnostics) > CPPCHECK_MAX_LOCATIONS:
+            result.write(f"  ... и еще {len(diagnostics) - CPPCHECK_MAX_LOCATIONS}")
+        result.penalize(ctx.penalty("PENALTY_CPPCHECK_ISSUES"))
+    else:
+        success("Статический анализ пройден без предупреждений")
+        result.write("OK: Статический анализ cppcheck пройден")
+
+def map_in_stage(func, items, jobs):
+    """Параллельный func над items внутри этапа: порядок результатов сохраняется,
+    команды пишутся в журнал текущего этапа"""
+    command_log = current_command_log.get()
+    
+    def run(item):
+        current_command_log.set(command_log)
+        return func(item)
+    
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        return list(executor.map(run, items))
+
+def is_compiler(token):
+    """Вызов компилятора: g++, /usr/bin/clang++, g++-12 и т. п."""
+    return re.sub(r"-\d+(\.\d+)*$", "", Path(token).name) in COMPILER_NAMES
+
+def generate_compile_commands(assignment_dir, dry_run_output):
+    """Записи compile_commands.json по командам компиляции из make --dry-run.
+    
+    Учитываются только строки, которые начинаются с компилятора (в том числе через ccache):
+    echo и printf с именем исходника в тексте не команды компиляции. Для каждого исходника
+    остается первая найденная команда.
+    """
+    entries = {}
+    for line in dry_run_output.split('\n'):
+        try:
+            tokens = shlex.split(line)
+        except ValueError:
+            continue
+        if tokens and Path(tokens[0]).name == "ccache":
+            tokens = tokens[1:]
+        if not tokens or not is_compiler(tokens[0]):
+            continue
+        sources = [token for token in tokens if Path(token).suffix in COMPILE_SOURCE_SUFFIXES]
+        if not sources:
+            continue
+        
+        # Из команды (в том числе сборки и линковки за один вызов) оставляем только
+        # флаги компиляции, а исходник подставляем для каждого файла отдельно
+        arguments = [tokens[0], "-Wno-unknown-warning-option"]
+        skip_next = False
+        for token in tokens[1:]:
+            if skip_next:
+                skip_next = False
+            elif token == "-o":
+                skip_next = True
+            elif token in sources or token == "-c" or token.startswith(("-l", "-L")):
+                continue
+            elif token.startswith("-"):
+                arguments.append(token)
+        
+        for source in sources:
+            file_path = (Path(assignment_dir) / source).resolve()
+            entries.setdefault(file_path, {
+                "directory": str(assignment_dir),
+                "file": str(file_path),
+                "arguments": arguments + ["-c", str(file_path)],
+            })
+    
+    return list(entries.values())
+
+def find_clang_tidy_config(directory):
+    """Ближайший .clang-tidy в каталоге или выше - тот, который clang-tidy нашел бы сам"""
+    for parent in [Path(directory).resolve(), *Path(directory).resolve().parents]:
+        config = parent / ".clang-tidy"
+        if config.is_file():
+            return config
+    return None
+
+@register_check("clang_tidy", cost=30, expensive=True)
+def stage_clang_tidy(ctx, result):
+    """Проверка clang-tidy: все единицы трансляции параллельно по compile_commands.json"""
+    log("Проверка clang-tidy...")
+    if subprocess.run(["which", "clang-tidy"], capture_output=True).returncode != 0:
+        warning("clang-tidy не установлен, пропускаем проверку")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: clang-tidy не установлен, проверка пропущена")
+        result.unavailable = True
+        return
+    
+    cpp_files = sorted(file_path.resolve() for file_path in ctx.sources.files
+                       if file_path.suffix == ".cpp")
+    compile_commands = generate_compile_commands(ctx.assignment_dir, ctx.make_dry_run)
+    known_files = {Path(entry["file"]) for entry in compile_commands}
+    
+    diagnostics = set()
+    issues_by_file = {}
+    timed_out = []
+    
+    # Копия задания в рабочем каталоге лежит вне /app, поэтому конфигурация ищется
+    # от исходного каталога студента и передается явно
+    config = find_clang_tidy_config(ctx.source_dir)
+    config_option = f"--config-file={shlex.quote(str(config))} " if config is not None else ""
+    
+    with tempfile.TemporaryDirectory(prefix="clang_tidy_") as db_dir:
+        with open(Path(db_dir) / "compile_commands.json", 'w', encoding='utf-8') as db:
+            json.dump(compile_commands, db)
+        
+        def check_file(cpp_file):
+            if cpp_file in known_files:
+                command = f"clang-tidy {config_option}-p {shlex.quote(db_dir)} {shlex.quote(str(cpp_file))}"
+            else:
+                command = f"clang-tidy {config_option}{shlex.quote(str(cpp_file))} -- -std=c++17"
+            return cpp_file, run_command(command, cwd=ctx.assignment_dir, timeout=TIMEOUT_SECONDS)
+        
+        jobs = CLANG_TIDY_JOBS or build_jobs(ctx.options)
+        for cpp_file, (returncode, stdout, stderr) in map_in_stage(check_file, cpp_files, jobs):
+            relative_path = cpp_file.relative_to(ctx.assignment_dir.resolve())
+            if returncode == 124:
+                timed_out.append(relative_path)
+                continue
+            
+            file_diagnostics = {match.groups() for match in
+                                CLANG_TIDY_DIAGNOSTIC_RE.finditer(stdout + stderr)}
+            if file_diagnostics:
+                issues_by_file[relative_path] = len(file_diagnostics)
+            # Предупреждения в общих заголовках повторяются в каждой единице трансляции
+            diagnostics |= file_diagnostics
+    
+    clang_tidy_issues = len(issues_by_file)
+    warnings_count = sum(1 for diagnostic in diagnostics if diagnostic[3] == "warning")
+    errors_count = len(diagnostics) - warnings_count
+    
+    result.write(f"clang-tidy: проверено файлов: {len(cpp_files)} "
+                 f"(из compile_commands.json: {len(known_files & set(cpp_files))}), "
+                 f"предупреждений: {warnings_count}, ошибок: {errors_count}")
+    for relative_path in timed_out:
+        result.write(f"  {relative_path}: превышен таймаут clang-tidy ({TIMEOUT_SECONDS} секунд)")
+    
+    if clang_tidy_issues > 0:
+        penalty = min(clang_tidy_issues, ctx.penalty("PENALTY_MAX_CLANG_TIDY"))
+        warning(f"Найдены предупреждения clang-tidy: {clang_tidy_issues} файлов")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Предупреждения clang-tidy (-{penalty} баллов)")
+        for relative_path in sorted(issues_by_file):
+            result.write(f"  {relative_path}: {issues_by_file[relative_path]} диагностик")
+        result.penalize(penalty)
+    else:
+        success("clang-tidy проверка пройдена без предупреждений")
+        result.write("OK: clang-tidy проверка пройдена")
+
+def find_executables(directory):
+    """Исполняемые файлы без расширения в каталоге"""
+    executable_files = []
+    for item in sorted(Path(directory).iterdir()):
+        if item.is_file() and os.access(item, os.X_OK) and not item.suffix:
+            executable_files.append(item.name)
+    return executable_files
+
+def find_makefile_executables(directory, dry_run_output):
+    """Исполняемые файлы, которые собирает Makefile: выходы (-o) команд линковки"""
+    targets = set()
+    for line in dry_run_output.split('\n'):
+        try:
+            tokens = shlex.split(line)
+        except ValueError:
+            continue
+        if "-c" in tokens or "-o" not in tokens:
+            continue
+        index = tokens.index("-o")
+        if index + 1 < len(tokens) and not Path(tokens[index + 1]).suffix:
+            targets.add(tokens[index + 1])
+    
+    return [name for name in sorted(targets)
+            if (Path(directory) / name).is_file() and os.access(Path(directory) / name, os.X_OK)]
+
+def memory_check_input(ctx):
+    """Стандартный ввод для проверяемых программ: файл из --memory-input или сценарий задания"""
+    if ctx.options.memory_input:
+        with open(ctx.options.memory_input, 'r', encoding='utf-8') as input_file:
+            return input_file.read()
+    return ctx.spec["memory_input"]
+
+def apply_memory_verdict(ctx, result, exe, verdict, engine):
+    """Запись результата проверки памяти одного исполняемого файла и штрафа за него"""
+    assignment = ctx.assignment
+    tool = "valgrind" if engine == "valgrind" else "AddressSanitizer"
+    definite, possible = MEMORY_LEAK_LABELS[engine]
+    suffix = "" if engine == "valgrind" else f" ({tool})"
+    
+    if verdict == "timeout":
+        warning(f"Исполняемый файл {exe} превысил таймаут {tool} в {assignment}")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Исполняемый файл {exe} превысил таймаут {tool} ({TIMEOUT_SECONDS} секунд) (-{ctx.penalty('PENALTY_VALGRIND_TIMEOUT')} балл)")
+        result.penalize(ctx.penalty("PENALTY_VALGRIND_TIMEOUT"))
+    elif verdict == "definite":
+        warning(f"Обнаружены утечки памяти ({definite}) в {exe} в {assignment}")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Утечки памяти ({definite}) в {exe}{suffix} (-{ctx.penalty('PENALTY_MEMORY_LEAKS_DEFINITE')} балла)")
+        result.penalize(ctx.penalty("PENALTY_MEMORY_LEAKS_DEFINITE"))
+    elif verdict == "possible":
+        warning(f"Обнаружены возможные утечки памяти ({possible}) в {exe} в {assignment}")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Возможные утечки памяти ({possible}) в {exe}{suffix} (-{ctx.penalty('PENALTY_MEMORY_LEAKS_POSSIBLE')} балл)")
+        result.penalize(ctx.penalty("PENALTY_MEMORY_LEAKS_POSSIBLE"))
+    elif verdict == "errors":
+        warning(f"Обнаружены ошибки памяти в {exe} в {assignment}")
+        result.write(f"ПРЕДУПРЕЖДЕНИЕ: Ошибки памяти в {exe}{suffix} (-{ctx.penalty('PENALTY_MEMORY_ERRORS')} балла)")
+        result.penalize(ctx.penalty("PENALTY_MEMORY_ERRORS"))
+    else:
+        success(f"Утечки памяти не обнаружены в {exe} в {assignment}")
+        result.write(f"OK: Утечки памяти не обнаружены в {exe}{suffix}")
+
+def parse_valgrind_verdict(returncode, valgrind_output):
+    """Итог запуска под valgrind: timeout, definite, possible, errors или clean"""
+    if returncode == 124:  # Timeout
+        return "timeout"
+    if "definitely lost" in valgrind_output and any(char.isdigit() for char in valgrind_output.split("definitely lost")[1].split()[0] if "definitely lost" in valgrind_output):
+        return "definite"
+    if "possibly lost" in valgrind_output:
+        return "possible"
+    if "ERROR SUMMARY:" in valgrind_output and any(char.isdigit() and char != '0' for char in valgrind_output.split("ERROR SUMMARY:")[1].split()[0] if "ERROR SUMMARY:" in valgrind_output):
+        return "errors"
+    return "clean"
+
+def parse_valgrind_xml(xml_path):
+    """Потоковый разбор --xml отчета valgrind: утечки по видам, ошибки и места в коде.
+    
+    Возвращает None, если отчет не создан. Обрезанный отчет (таймаут) разбирается
+    до места обрыва.
+    """
+    if not Path(xml_path).is_file() or Path(xml_path).stat().st_size == 0:
+        return None
+    
+    summary = {"leaked_bytes": {}, "errors": {}, "locations": []}
+    root = None
+    try:
+        for event, element in ElementTree.iterparse(str(xml_path), events=("start", "end")):
+            if root is None:
+                root = element
+            if event != "end" or element.tag != "error":
+                continue
+            
+            kind = element.findtext("kind", "")
+            if kind.startswith("Leak_"):
+                leaked = int(element.findtext("xwhat/leakedbytes", "0") or 0)
+                summary["leaked_bytes"][kind] = summary["leaked_bytes"].get(kind, 0) + leaked
+            else:
+                summary["errors"][kind] = summary["errors"].get(kind, 0) + 1
+            
+            # Верхний кадр стека в коде студента (с файлом исходника)
+            for frame in element.iterfind("stack/frame"):
+                if frame.findtext("file"):
+                    location = f"{frame.findtext('file')}:{frame.findtext('line', '?')} ({frame.findtext('fn', '?')})"
+                    summary["locations"].append((kind, location))
+                    break
+            
+            # Разобранные ошибки удаляются из дерева, память не растет с размером отчета
+            root.clear()
+    except ElementTree.ParseError:
+        pass
+    
+    return summary
+
+def valgrind_xml_verdict(returncode, summary):
+    """Итог запуска под valgrind по разобранному XML отчету"""
+    if returncode == 124:
+        return "timeout"
+    if summary["leaked_bytes"].get("Leak_DefinitelyLost", 0) > 0:
+        return "definite"
+    if summary["leaked_bytes"].get("Leak_PossiblyLost", 0) > 0:
+        return "possible"
+    if summary["errors"]:
+        return "errors"
+    return "clean"
+
+def write_valgrind_details(result, summary):
+    """Подробности XML отчета valgrind: байты утечек, виды ошибок, места в коде"""
+    leaks = ", ".join(f"{kind[len('Leak_'):]}: {leaked} байт"
+                      for kind, leaked in sorted(summary["leaked_bytes"].items()) if leaked)
+    if leaks:
+        result.write(f"  Утечки: {leaks}")
+    if summary["errors"]:
+        errors = ", ".join(f"{kind} x{count}" for kind, count in sorted(summary["errors"].items()))
+        result.write(f"  Ошибки: {errors}")
+    for kind, location in summary["locations"][:VALGRIND_MAX_LOCATIONS]:
+        result.write(f"  {kind}: {location}")
+
+def parse_sanitizer_verdict(returncode, reports):
+    """Итог запуска с санитайзерами по их отчетам: timeout, definite, errors или clean"""
+    if returncode == 124:
+        return "timeout"
+    if SANITIZER_LEAK_RE.search(reports):
+        return "definite"
+    if SANITIZER_ERROR_RE.search(reports):
+        return "errors"
+    return "clean"
+
+def build_with_sanitizers(ctx, work_dir):
+    """Сборка копии задания с -fsanitize=address,undefined; True при успехе"""
+    shutil.copytree(ctx.assignment_dir, work_dir, symlinks=True,
+                    ignore=shutil.ignore_patterns(".git", "*.o"))
+    
+    # Обертки с именами компиляторов добавляют флаги санитайзеров и при компиляции,
+    # и при линковке, не трогая CXXFLAGS из Makefile студента
+    bin_dir = Path(work_dir).parent / "bin"
+    bin_dir.mkdir()
+    for compiler in COMPILER_NAMES:
+        compiler_path = shutil.which(compiler)
+        if compiler_path:
+            wrapper = bin_dir / compiler
+            wrapper.write_text(f'#!/bin/sh\nexec {shlex.quote(compiler_path)} "$@" {SANITIZER_FLAGS}\n')
+            wrapper.chmod(0o755)
+    
+    env = {"PATH": f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"}
+    run_command("make clean", cwd=work_dir, env=env)
+    returncode, _, _ = run_command("make", cwd=work_dir, env=env, timeout=TIMEOUT_SECONDS * 4)
+    return returncode == 0
+
+def check_memory_with_sanitizers(ctx, result, executable_files, input_text):
+    """Проверка памяти сборкой с санитайзерами; False, если сборка не удалась"""
+    with tempfile.TemporaryDirectory(prefix="sanitizer_") as scratch_dir:
+        work_dir = Path(scratch_dir) / "src"
+        if not build_with_sanitizers(ctx, work_dir):
+            return False
+        
+        instrumented = [exe for exe in executable_files
+                        if (work_dir / exe).is_file() and b"__asan_init" in (work_dir / exe).read_bytes()]
+        if not instrumented:
+            return False
+        
+        result.write("Проверка памяти: сборка с -fsanitize=address,undefined")
+        
+        def check_executable(exe):
+            log_prefix = Path(scratch_dir) / f"{exe}.sanitizer"
+            env = {
+                "ASAN_OPTIONS": f"detect_leaks=1:halt_on_error=0:log_path={log_prefix}",
+                "UBSAN_OPTIONS": f"print_stacktrace=1:halt_on_error=0:log_path={log_prefix}",
+            }
+            returncode, _, _ = run_command(f"./{exe}", cwd=work_dir, timeout=TIMEOUT_SECONDS,
+                                           input_text=input_text, env=env, limits=MEMORY_CHECK_LIMITS)
+            
+            reports = ""
+            for report_file in sorted(Path(scratch_dir).glob(f"{exe}.sanitizer*")):
+                reports += report_file.read_text(encoding="utf-8", errors="replace")
+            return exe, returncode, reports
+        
+        for exe, returncode, reports in map_in_stage(check_executable, instrumented, MEMORY_CHECK_JOBS):
+            result.output += reports
+            apply_memory_verdict(ctx, result, exe, parse_sanitizer_verdict(returncode, reports), "sanitizer")
+    
+    return True
+
+@register_check("memory", needs_build=True, cost=30, expensive=True)
+def stage_memory(ctx, result):
+    """Проверка утечек и ошибок памяти: санитайзеры или valgrind в зависимости от задания"""
+    assignment_dir = ctx.assignment_dir
+    assignment = ctx.assignment
+    
+    log("Проверка утечек памяти...")
+    # Цели сборки из Makefile; если их не удалось определить - все исполняемые файлы каталога
+    executable_files = (find_makefile_executables(assignment_dir, ctx.make_dry_run)
+                        or find_executables(assignment_dir))[:MEMORY_CHECK_MAX_EXECUTABLES]
+    result.write(f"Найдены исполняемые файлы: {executable_files}")
+    
+    if not executable_files:
+        warning(f"Исполняемые файлы не найдены для проверки утечек памяти в {assignment}")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: Исполняемые файлы не найдены, проверка утечек памяти пропущена")
+        return
+    
+    input_text = memory_check_input(ctx)
+    
+    engine = ctx.options.memory_check or ctx.spec["memory_check"]
+    if engine == "sanitizer":
+        if check_memory_with_sanitizers(ctx, result, executable_files, input_text):
+            return
+        warning(f"Не удалось собрать {assignment} с санитайзерами, используется valgrind")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: Сборка с санитайзерами не удалась, проверка памяти через valgrind")
+    
+    if subprocess.run(["which", "valgrind"], capture_output=True).returncode != 0:
+        warning(f"valgrind не установлен, пропускаем проверку утечек памяти в {assignment}")
+        result.write("ПРЕДУПРЕЖДЕНИЕ: valgrind не установлен, проверка утечек памяти пропущена")
+        result.unavailable = True
+        return
+    
+    def check_executable(exe):
+        with tempfile.TemporaryDirectory(prefix="valgrind_") as xml_dir:
+            xml_path = Path(xml_dir) / f"{exe}.xml"
+            returncode, stdout, stderr = run_command(
+                f"valgrind --tool=memcheck --leak-check=full --error-exitcode=1 "
+                f"--xml=yes --xml-file={shlex.quote(str(xml_path))} ./{exe}",
+                cwd=assignment_dir, timeout=TIMEOUT_SECONDS, input_text=input_text,
+                limits=MEMORY_CHECK_LIMITS
+            )
+            return exe, returncode, stdout + stderr, parse_valgrind_xml(xml_path)
+    
+    for exe, returncode, output, summary in map_in_stage(check_executable, executable_files, MEMORY_CHECK_JOBS):
+        if summary is None:
+            # XML отчет не создан (valgrind не запустился) - разбираем текстовый вывод
+            apply_memory_verdict(ctx, result, exe, parse_valgrind_verdict(returncode, output), "valgrind")
+            continue
+        
+        apply_memory_verdict(ctx, result, exe, valgrind_xml_verdict(returncode, summary), "valgrind")
+        write_valgrind_details(result, summary)
+
+def normalize_assignment_spec(assignment, spec):
+    """Спецификация задания с настройками по умолчанию; ValueError, если она некорректна"""
+    if not isinstance(spec, dict) or not isinstance(spec.get("checks"), list):
+        raise ValueError(f"{assignment}: в спецификации нет списка этапов checks")
+    
+    unknown_fields = set(spec) - set(ASSIGNMENT_SPEC_DEFAULTS) - {"checks"}
+    if unknown_fields:
+        raise ValueError(f"{assignment}: неизвестные поля спецификации: {', '.join(sorted(unknown_fields))}")
+    
+    unknown_checks = [name for name in spec["checks"] if name not in CHECK_REGISTRY]
+    if unknown_checks:
+        raise ValueError(f"{assignment}: неизвестные этапы: {', '.join(unknown_checks)} "
+                         f"(доступны: {', '.join(CHECK_REGISTRY)})")
+    
+    unknown_penalties = [name for name in spec.get("penalties", {})
+                         if not name.startswith("PENALTY_") or name not in globals()]
+    if unknown_penalties:
+        raise ValueError(f"{assignment}: неизвестные штрафы: {', '.join(unknown_penalties)}")
+    
+    normalized = {**ASSIGNMENT_SPEC_DEFAULTS, **spec}
+    if normalized["memory_check"] not in ("sanitizer", "valgrind"):
+        raise ValueError(f"{assignment}: memory_check должен быть sanitizer или valgrind")
+    try:
+        build_stages(normalized["checks"])  # Проверка зависимостей до начала проверки студентов
+    except ValueError as e:
+        raise ValueError(f"{assignment}: {e}") from None
+    return normalized
+
+def load_assignment_specs(path=None):
+    """Спецификации всех заданий: из JSON-файла или ASSIGNMENT_SPECS; загружаются один раз при запуске"""
+    specs = ASSIGNMENT_SPECS
+    if path:
+        with open(path, 'r', encoding='utf-8') as spec_file:
+            specs = json.load(spec_file)
+        if not isinstance(specs, dict):
+            raise ValueError(f"{path}: ожидается объект {{задание: спецификация}}")
+    return {assignment: normalize_assignment_spec(assignment, spec) for assignment, spec in specs.items()}
+
+def build_stages(checks):
+    """Граф этапов задания: (имя, функция, зависимости) в порядке вывода в отчет"""
+    # Статические этапы работают только с исходниками и идут параллельно со сборкой.
+    # Этапы, которым нужны результаты сборки, выстроены в цепочку, чтобы make test
+    # не пересобирал бинарники, пока их запускает valgrind
+    stages = []
+    build_chain = None
+    
+    for name in checks:
+        plugin = CHECK_REGISTRY[name]
+        deps = [dep for dep in plugin.deps if dep in checks]
+        if plugin.needs_build:
+            if build_chain is None:
+                raise ValueError(f"Этап {name} должен идти после этапа build")
+            deps.append(build_chain)
+            build_chain = name
+        elif name == "build":
+            build_chain = name
+        stages.append((name, plugin.func, deps))
+    
+    return stages
+
+def run_stage(func, ctx, result):
+    """Запуск одного этапа с замером времени и журналом запущенных команд"""
+    token = current_command_log.set(result.commands)
+    result.started_at = time.time()
+    started = time.monotonic()
+    report_progress("stage_started", ctx.student_name, ctx.assignment, result.name)
+    try:
+        func(ctx, result)
+    finally:
+        result.duration = time.monotonic() - started
+        current_command_log.reset(token)
+        report_progress("stage_finished", ctx.student_name, ctx.assignment, result.name)
+
+def policy_skip_reason(ctx, name, results):
+    """Почему дорогой этап не нужно запускать по политике проверки (None - запускать)"""
+    plugin = CHECK_REGISTRY.get(name)
+    if plugin is None or not plugin.expensive:
+        return None
+    
+    policy = ctx.options.policy
+    if policy == "fast":
+        return "быстрый режим проверки"
+    if policy == "early-exit":
+        # Штрафы только уменьшают балл, поэтому оценка "Неудовлетворительно" уже не изменится
+        penalty = 0
+        for result in results.values():
+            penalty += result.penalty
+            if result.aborted:
+                break
+        score = ctx.score_before - penalty
+        if score < GRADE_SATISFACTORY:
+            return f"балл не выше {score} при пороге {GRADE_SATISFACTORY}, оценка не изменится"
+    return None
+
+def run_stages(stages, ctx, jobs):
+    """Выполнение этапов по графу зависимостей, независимые этапы - параллельно.
+    
+    Из готовых к запуску этапов первыми запускаются дешевые, чтобы к моменту решения
+    о дорогих этапах политика проверки знала как можно больше штрафов.
+    """
+    results = {name: StageResult(name) for name, _, _ in stages}
+    pending = {name: (func, deps) for name, func, deps in stages}
+    running = {}
+    done = set()
+    
+    def cost(name):
+        plugin = CHECK_REGISTRY.get(name)
+        return plugin.cost if plugin is not None else 1
+    
+    workers = max(1, jobs)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            progressed = False
+            for name in sorted(pending, key=cost):
+                if len(running) >= workers:
+                    # Остальные этапы ждут свободного места, чтобы порядок запуска
+                    # и решения политики учитывали уже завершившиеся этапы
+                    break
+                func, deps = pending[name]
+                if not all(dep in done for dep in deps):
+                    continue
+                del pending[name]
+                progressed = True
+                if any(results[dep].aborted or results[dep].skipped for dep in deps):
+                    results[name].skipped = True
+                    done.add(name)
+                    continue
+                
+                reason = policy_skip_reason(ctx, name, results)
+                if reason is not None:
+                    log(f"Этап {name} пропущен: {reason}")
+                    results[name].write(f"ПРОПУЩЕНО: этап {name} не выполнялся ({reason})")
+                    results[name].omitted = True
+                    done.add(name)
+                else:
+                    running[executor.submit(run_stage, func, ctx, results[name])] = name
+            
+            if not running:
+                if not progressed:
+                    raise ValueError(f"Неразрешимые зависимости этапов: {', '.join(pending)}")
+                continue
+            
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                done.add(name)
+    
+    return [results[name] for name, _, _ in stages]
+
+class WorkspaceFull(Exception):
+    """В рабочем каталоге кончилось место: ошибка проверяющего, а не студента"""
+
+def makefile_outputs(directory, dry_run_output):
+    """Файлы, которые создает Makefile: выходы -o, объектные файлы от -c без -o и архивы ar"""
+    outputs = set()
+    for line in dry_run_output.split('\n'):
+        try:
+            tokens = shlex.split(line)
+        except ValueError:
+            continue
+        if not tokens:
+            continue
+        if "-o" in tokens and tokens.index("-o") + 1 < len(tokens):
+            outputs.add(tokens[tokens.index("-o") + 1])
+        elif "-c" in tokens:
+            outputs.update(str(Path(token).with_suffix(".o").name) for token in tokens
+                           if Path(token).suffix in COMPILE_SOURCE_SUFFIXES)
+        elif Path(tokens[0]).name in ("ar", "gcc-ar", "llvm-ar") and len(tokens) > 2:
+            outputs.add(tokens[2])
+    return {(Path(directory) / output).resolve() for output in outputs}
+
+def workspace_entries(source_dir, build_outputs=frozenset()):
+    """Каталоги и файлы задания для рабочего каталога: без .git и файлов, которые создает Makefile.
+    
+    Остальные файлы копируются все, в том числе готовые библиотеки и бинарники,
+    с которыми студент собирает проект.
+    """
+    directories = []
+    files = []
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = sorted(name for name in dirnames if name not in WORKSPACE_SKIP_DIRS)
+        directories += [Path(dirpath, name).relative_to(source_dir) for name in dirnames]
+        for name in sorted(filenames):
+            path = Path(dirpath, name)
+            if path.is_file() and path.resolve() not in build_outputs:
+                files.append(path.relative_to(source_dir))
+    return directories, files
+
+def allows_exec(directory):
+    """Можно ли запускать программы из каталога (tmpfs в Docker по умолчанию смонтирован noexec)"""
+    try:
+        with tempfile.TemporaryDirectory(prefix="checker_exec_", dir=directory) as probe_dir:
+            probe = Path(probe_dir) / "probe.sh"
+            probe.write_text("#!/bin/sh\nexit 0\n")
+            probe.chmod(0o755)
+            return subprocess.run([str(probe)], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL, timeout=10).returncode == 0
+    except (OSError, subprocess.SubprocessError):
+        return False
+
+@functools.lru_cache(maxsize=None)
+def workspace_root():
+    """Корень рабочих каталогов: tmpfs, если в нем можно создавать и запускать файлы,
+    иначе системный временный каталог"""
+    root = Path(WORKSPACE_ROOT)
+    if root.is_dir() and os.access(root, os.W_OK) and allows_exec(root):
+        return root
+    if root.is_dir():
+        warning(f"В {root} нельзя запускать собранные программы (noexec), рабочие каталоги "
+                f"создаются в {tempfile.gettempdir()}")
+    return Path(tempfile.gettempdir())
+
+@contextlib.contextmanager
+def assignment_workspace(ctx):
+    """Проверка задания в его копии во временном каталоге, который удаляется после проверки.
+    
+    Сборка не идет по медленному тому с работами студентов и не оставляет в нем артефактов.
+    Если рабочие каталоги отключены, а задание больше WORKSPACE_MAX_BYTES или не помещается
+    во временный каталог, проверка идет прямо в каталоге студента. Копируются все файлы,
+    кроме тех, что создает Makefile (по make --dry-run в каталоге студента).
+    """
+    if not ctx.options.workspace:
+        yield
+        return
+    
+    build_outputs = makefile_outputs(ctx.source_dir, make_dry_run(ctx.source_dir))
+    directories, files = workspace_entries(ctx.source_dir, build_outputs)
+    size = sum((ctx.source_dir / relative_path).stat().st_size for relative_path in files)
+    root = workspace_root()
+    if size > WORKSPACE_MAX_BYTES or shutil.disk_usage(root).free < size * 4:
+        warning(f"{ctx.assignment}: {size // 1024} КБ исходников не помещаются в рабочий каталог, "
+                "проверка в каталоге студента")
+        yield
+        return
+    
+    workspace = tempfile.mkdtemp(prefix=f"checker_{ctx.student_name}_", dir=root)
+    try:
+        work_dir = Path(workspace) / ctx.assignment
+        copied = True
+        try:
+            work_dir.mkdir()
+            for relative_path in directories:
+                (work_dir / relative_path).mkdir(parents=True, exist_ok=True)
+            for relative_path in files:
+                shutil.copy2(ctx.source_dir / relative_path, work_dir / relative_path)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                raise
+            copied = False
+        if not copied:
+            warning(f"{ctx.assignment}: задание не поместилось в {root}, проверка в каталоге студента")
+            yield
+            return
+        
+        ctx.assignment_dir = work_dir
+        ctx.workspace_root = root
+        yield
+    finally:
+        ctx.assignment_dir = ctx.source_dir
+        ctx.workspace_root = None
+        shutil.rmtree(workspace, ignore_errors=True)
+
+def grade_assignment(ctx):
+    """Проверка одного задания: словарь с результатами всех этапов"""
+    # Все команды запускаются с cwd=assignment_dir, без глобального os.chdir,
+    # чтобы студентов можно было проверять параллельно в разных процессах
+    started = time.monotonic()
+    try:
+        with assignment_workspace(ctx):
+            stage_results = run_stages(build_stages(ctx.spec["checks"]), ctx, ctx.options.stage_jobs)
+    except WorkspaceFull as e:
+        # Нехватка места на tmpfs не должна стоить студенту штрафа за сборку
+        warning(f"{ctx.assignment}: {e}, повторная проверка в каталоге студента")
+        ctx.forget_directory()
+        stage_results = run_stages(build_stages(ctx.spec["checks"]), ctx, ctx.options.stage_jobs)
+    
+    checks = []
+    penalty = 0
+    aborted = False
+    for result in stage_results:
+        check = result.to_dict()
+        if aborted and check["status"] != "skipped":
+            # Этапы после критической ошибки выполнились параллельно, но не засчитываются
+            check["status"] = "discarded"
+        elif check["status"] != "skipped":
+            penalty += result.penalty
+            aborted = result.aborted
+        checks.append(check)
+    
+    return {
+        "name": ctx.assignment,
+        "path": str(ctx.source_dir),
+        "status": "build_failed" if aborted else "checked",
+        "penalty": penalty,
+        "cached": False,
+        "duration": round(time.monotonic() - started, 3),
+        "checks": checks,
+    }
+
+def grade_label(score):
+    """Название оценки по баллу"""
+    if score >= GRADE_EXCELLENT:
+        return "Отлично"
+    if score >= GRADE_GOOD:
+        return "Хорошо"
+    if score >= GRADE_SATISFACTORY:
+        return "Удовлетворительно"
+    return "Неудовлетворительно"
+
+def render_student_report(student_result):
+    """Текстовый отчет по студенту из структурированного результата"""
+    name = student_result["student"]
+    lines = [f"=== ОТЧЕТ ПО ПРОВЕРКЕ СТУДЕНТА: {name} ===",
+             f"Начальный балл: {student_result['initial_score']}", ""]
+    
+    if student_result["assignments_folder"] is None:
+        lines.append("КРИТИЧЕСКАЯ ОШИБКА: Папка с заданиями не найдена")
+        lines.append("Структура директории студента:")
+        lines += student_result["directory_listing"]
+    else:
+        lines.append(f"Папка с заданиями: {student_result['assignments_folder']}")
+        lines.append("")
+        
+        for assignment in student_result["assignments"]:
+            lines.append(f"--- Проверка {assignment['name']} ---")
+            lines.append(f"Путь: {assignment['path']}")
+            
+            if assignment["status"] == "missing":
+                lines.append(f"КРИТИЧЕСКАЯ ОШИБКА: Директория {assignment['name']} отсутствует "
+                             f"(-{assignment['penalty']} баллов)")
+                lines.append(f"Доступные папки в {Path(student_result['assignments_folder']).name}:")
+                lines += assignment["available"]
+                continue
+            
+            for check in assignment["checks"]:
+                if check["status"] not in ("skipped", "discarded"):
+                    lines += check["lines"]
+            lines.append("")
+    
+    lines.append(f"=== ИТОГОВЫЙ БАЛЛ: {student_result['score']}/{student_result['initial_score']} ===")
+    return "\n".join(lines) + "\n"
+
+def check_student(student_dir, options=None):
+    """Основная функция проверки студента: структурированный результат и текстовый отчет"""
+    if options is None:
+        options = parse_args([])
+    student_name = Path(student_dir).name
+    cache = None if options.no_cache else ResultCache(options.cache_dir)
+    started = time.monotonic()
+    
+    log(f"Проверка студента: {student_name}")
+    
+    student_result = {
+        "student": student_name,
+        "initial_score": INITIAL_SCORE,
+        "assignments_folder": None,
+        "assignments": [],
+    }
+    total_score = INITIAL_SCORE
+    
+    # Работы из git-зеркал: папка с заданиями уже найдена, неизменившиеся задания не проверяются
+    ingested = options.ingested.get(student_name, {})
+    assignments_base_dir = ingested.get("assignments_folder") or find_assignments_folder(student_dir)
+    
+    if not assignments_base_dir:
+        error(f"Папка с заданиями не найдена у студента {student_name}")
+        student_result["directory_listing"] = [str(item) for item in Path(student_dir).rglob("*")
+                                               if item.is_dir()]
+        total_score -= PENALTY_NO_ASSIGNMENTS_FOLDER
+    else:
+        success(f"Найдена папка с заданиями: {assignments_base_dir}")
+        student_result["assignments_folder"] = assignments_base_dir
+        
+        # Проверка каждого задания
+        for assignment, spec in options.specs.items():
+            assignment_dir = Path(assignments_base_dir) / assignment
+            
+            if not assignment_dir.is_dir():
+                error(f"Директория {assignment} не найдена у студента {student_name}")
+                try:
+                    available = [item.name for item in Path(assignments_base_dir).iterdir()]
+                except:
+                    available = ["Не удается прочитать содержимое"]
+                
+                student_result["assignments"].append({
+                    "name": assignment,
+                    "path": str(assignment_dir),
+                    "status": "missing",
+                    "penalty": PENALTY_NO_ASSIGNMENT_DIR,
+                    "available": available,
+                })
+                total_score -= PENALTY_NO_ASSIGNMENT_DIR
+                continue
+            
+            ctx = AssignmentContext(student_name, assignment, assignment_dir, options, spec)
+            ctx.score_before = total_score
+            
+            assignment_result = ingested.get("reuse", {}).get(assignment)
+            if assignment_result is None and cache is not None:
+                cache_key = cache.key(student_name, assignment, assignment_dir, effective_spec(spec, options))
+                assignment_result = cache.get(cache_key)
+            
+            if assignment_result is not None:
+                log(f"{assignment} не изменился с прошлой проверки, результат взят из кэша")
+                assignment_result["cached"] = True
+            else:
+                assignment_result = grade_assignment(ctx)
+                # Неполный результат (часть этапов пропущена политикой) не кэшируется
+                if cache is not None and not any(check["status"] == "skipped_by_policy"
+                                                 for check in assignment_result["checks"]):
+                    cache.put(cache_key, assignment_result)
+            
+            student_result["assignments"].append(assignment_result)
+            total_score -= assignment_result["penalty"]
+    
+    student_result["score"] = total_score
+    student_result["grade"] = grade_label(total_score)
+    student_result["duration"] = round(time.monotonic() - started, 3)
+    
+    reports_path = Path(REPORTS_DIR)
+    reports_path.mkdir(parents=True, exist_ok=True)
+    report_file = reports_path / f"{student_name}_report.txt"
+    with open(report_file, 'w', encoding='utf-8') as f:
+        f.write(render_student_report(student_result))
+    
+    # Итоговая оценка
+    if assignments_base_dir:
+        message = f"Студент {student_name}: {total_score}/{INITIAL_SCORE} баллов ({student_result['grade']})"
+        if total_score >= GRADE_EXCELLENT:
+            success(message)
+        elif total_score >= GRADE_SATISFACTORY:
+            warning(message)
+        else:
+            error(message)
+    
+    print(f"{student_name}: {total_score}/{INITIAL_SCORE}")
+    return student_result
+
+def grade_student(student_dir, options):
+    """Проверка одного студента в отдельном процессе-воркере"""
+    student_name = Path(student_dir).name
+    report_progress("student_started", student_name)
+    try:
+        return student_name, check_student(str(student_dir), options), None
+    except Exception as e:
+        return student_name, None, str(e)
+
+def grade_students(student_dirs, options, on_result=None):
+    """Проверка всех студентов, при jobs > 1 - в пуле процессов.
+    
+    on_result(student_name, student_result, err) вызывается сразу по завершении
+    проверки каждого студента, в порядке завершения.
+    """
+    results = {}
+    report_progress("students_queued", len(student_dirs))
+    
+    def collect(student_name, student_result, err):
+        results[student_name] = (student_result, err)
+        report_progress("student_finished", student_name, student_result, err)
+        if on_result is not None:
+            on_result(student_name, student_result, err)
+    
+    jobs = options.jobs
+    if jobs <= 1:
+        for student_dir in student_dirs:
+            log(f"Найден студент: {student_dir.name}")
+            collect(*grade_student(student_dir, options))
+        return results
+    
+    # События о ходе проверки из процессов пула передаются получателю через очередь
+    events = multiprocessing.Queue() if progress_events is not None else None
+    forwarder = None
+    if events is not None:
+        forwarder = threading.Thread(target=forward_progress_events, args=(events,), daemon=True)
+        forwarder.start()
+    
+    log(f"Параллельная проверка: {jobs} процессов")
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_progress_events,
+                                 initargs=(events,)) as executor:
+            futures = {}
+            for student_dir in student_dirs:
+                log(f"Найден студент: {student_dir.name}")
+                futures[executor.submit(grade_student, student_dir, options)] = student_dir.name
+            
+            for future in as_completed(futures):
+                try:
+                    student_name, student_result, err = future.result()
+                except Exception as e:
+                    student_name, student_result, err = futures[future], None, str(e)
+                collect(student_name, student_result, err)
+    finally:
+        if forwarder is not None:
+            events.put(None)
+            forwarder.join()
+    
+    return results
+
+def iter_timed_checks(student_result):
+    """Этапы студента, которые действительно выполнялись в этом запуске (без кэша)"""
+    for assignment in student_result.get("assignments", []):
+        if assignment.get("cached") or "checks" not in assignment:
+            continue
+        for check in assignment["checks"]:
+            if check["status"] not in ("skipped", "skipped_by_policy"):
+                yield assignment, check
+
+def write_timing_tables(f, results):
+    """Таблицы времени проверки по студентам и по этапам для сводного отчета"""
+    f.write("\nВремя проверки по студентам (сек, CPU сек, пик памяти МБ, самый долгий этап):\n")
+    stage_totals = {}
+    
+    for student_name in sorted(results):
+        student_result, err = results[student_name]
+        if student_result is None:
+            continue
+        
+        checks = list(iter_timed_checks(student_result))
+        cpu_time = sum(check["cpu_time"] for _, check in checks)
+        max_rss = max((check["max_rss_kb"] for _, check in checks), default=0)
+        slowest = max(checks, key=lambda item: item[1]["duration"], default=None)
+        slowest_name = f"{slowest[0]['name']}/{slowest[1]['name']} ({slowest[1]['duration']:.1f})" if slowest else "-"
+        f.write(f"{student_name}: {student_result['duration']:.1f} / {cpu_time:.1f} / "
+                f"{max_rss / 1024:.0f} / {slowest_name}\n")
+        
+        for _, check in checks:
+            totals = stage_totals.setdefault(check["name"], {"count": 0, "wall": 0.0, "max": 0.0,
+                                                             "cpu": 0.0, "rss": 0})
+            totals["count"] += 1
+            totals["wall"] += check["duration"]
+            totals["max"] = max(totals["max"], check["duration"])
+            totals["cpu"] += check["cpu_time"]
+            totals["rss"] = max(totals["rss"], check["max_rss_kb"])
+    
+    f.write("\nВремя по этапам (запусков, всего сек, среднее, максимум, CPU сек, пик памяти МБ):\n")
+    for name, totals in sorted(stage_totals.items(), key=lambda item: -item[1]["wall"]):
+        f.write(f"{name}: {totals['count']}, {totals['wall']:.1f}, {totals['wall'] / totals['count']:.2f}, "
+                f"{totals['max']:.1f}, {totals['cpu']:.1f}, {totals['rss'] / 1024:.0f}\n")
+
+def write_chrome_trace(path, results):
+    """Экспорт времени этапов и команд в формате Chrome Trace (chrome://tracing, Perfetto)"""
+    events = []
+    timed = [(student_name, student_result) for student_name, (student_result, _) in sorted(results.items())
+             if student_result is not None]
+    origin = min((check["started_at"] for _, student_result in timed
+                  for _, check in iter_timed_checks(student_result)), default=0.0)
+    
+    for pid, (student_name, student_result) in enumerate(timed, start=1):
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": student_name}})
+        for assignment, check in iter_timed_checks(student_result):
+            tid = f"{assignment['name']}:{check['name']}"
+            events.append({"name": check["name"], "cat": "stage", "ph": "X", "pid": pid, "tid": tid,
+                           "ts": (check["started_at"] - origin) * 1e6, "dur": check["duration"] * 1e6,
+                           "args": {"status": check["status"], "penalty": check["penalty"],
+                                    "cpu_time": check["cpu_time"], "max_rss_kb": check["max_rss_kb"]}})
+            for command in check["commands"]:
+                events.append({"name": command["command"][:60], "cat": "command", "ph": "X",
+                               "pid": pid, "tid": tid,
+                               "ts": (command["started_at"] - origin) * 1e6,
+                               "dur": command["wall_time"] * 1e6,
+                               "args": command})
+    
+    with open(path, 'w', encoding='utf-8') as tf:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, tf, ensure_ascii=False)
+
+class JsonlWriter:
+    """Построчная запись результатов в JSONL сразу по мере готовности"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.file = open(self.path, 'w', encoding='utf-8')
+
+    def __call__(self, student_name, student_result, err):
+        record = student_result if err is None else {"student": student_name, "error": err}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class RunJournal:
+    """Журнал запуска: результат каждого проверенного студента в отдельном файле.
+    
+    Файлы пишутся атомарно сразу после проверки студента, поэтому после падения
+    или прерывания проверку можно продолжить с --resume. Студенты, проверка которых
+    завершилась ошибкой, в журнал не попадают и при продолжении проверяются снова.
+    """
+
+    def __init__(self, directory, resume=False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not resume:
+            for entry_path in self.directory.glob("*.json"):
+                entry_path.unlink()
+
+    def __call__(self, student_name, student_result, err):
+        if err is None and student_result is not None:
+            write_json_atomic(self.directory / f"{student_name}.json", student_result)
+
+    def load(self):
+        """Результаты из журнала: студент -> (результат, None)"""
+        results = {}
+        for entry_path in sorted(self.directory.glob("*.json")):
+            try:
+                with open(entry_path, 'r', encoding='utf-8') as f:
+                    results[entry_path.stem] = (json.load(f), None)
+            except (OSError, ValueError) as e:
+                warning(f"Запись журнала {entry_path.name} не прочитана: {e}")
+        return results
+
+# =============================================================================
+# ЗАГРУЗКА РАБОТ ИЗ GIT-ЗЕРКАЛ
+# =============================================================================
+
+class GitIngestion:
+    """Загрузка работ студентов из локальных bare-репозиториев student*.git.
+    
+    В репозиторий забираются только новые коммиты (git fetch, если у него есть remote),
+    коммит HEAD извлекается в GIT_CHECKOUT_DIR. Хэши деревьев заданий сравниваются с
+    последним проверенным коммитом: студент без изменений не проверяется вовсе, у
+    остальных заново проверяются только изменившиеся задания. Последний проверенный
+    коммит, папка с заданиями и результаты хранятся в GIT_INGEST_STATE_DIR и
+    обновляются после успешной проверки студента.
+    """
+
+    def __init__(self, mirrors_dir, checkout_dir=None):
+        self.mirrors_dir = Path(mirrors_dir)
+        self.checkout_dir = Path(GIT_CHECKOUT_DIR if checkout_dir is None else checkout_dir)
+        self.state_dir = self.checkout_dir / GIT_INGEST_STATE_DIR
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        self.ingested = {}   # Студент -> папка с заданиями и результаты неизменившихся заданий
+        self.pending = {}    # Студент -> состояние, записываемое после его проверки
+
+    def git(self, repo, command):
+        return run_command(f"git --git-dir={shlex.quote(str(repo))} {command}", timeout=GIT_TIMEOUT_SECONDS)
+
+    def repositories(self):
+        """Репозитории студентов: имя студента -> путь"""
+        repos = {}
+        if self.mirrors_dir.is_dir():
+            for item in sorted(self.mirrors_dir.iterdir()):
+                name = item.name[:-len(".git")] if item.name.endswith(".git") else item.name
+                if item.is_dir() and name.startswith("student"):
+                    repos[name] = item
+        return repos
+
+    def fetch(self, repo):
+        """Новые коммиты из remote (если он есть); хэш коммита HEAD"""
+        returncode, stdout, _ = self.git(repo, "remote")
+        remotes = stdout.split()
+        if returncode == 0 and remotes:
+            returncode, stdout, stderr = self.git(
+                repo, f"fetch --prune --quiet {shlex.quote(remotes[0])} '+refs/heads/*:refs/heads/*'")
+            if returncode != 0:
+                warning(f"git fetch для {repo.name} не удался, используется локальная копия: "
+                        f"{(stdout + stderr).strip()[:200]}")
+        
+        returncode, stdout, _ = self.git(repo, "rev-parse --verify --quiet 'HEAD^{commit}'")
+        if returncode != 0:
+            raise RuntimeError("в репозитории нет коммитов")
+        return stdout.strip()
+
+    def subtrees(self, repo, treeish):
+        """Подпапки дерева: имя -> хэш дерева, или None, если дерева нет"""
+        returncode, stdout, _ = self.git(repo, f"ls-tree -d -z {shlex.quote(treeish)}")
+        if returncode != 0:
+            return None
+        trees = {}
+        for entry in stdout.split("\0"):
+            if "\t" in entry:
+                meta, name = entry.split("\t", 1)
+                trees[name] = meta.split()[2]
+        return trees
+
+    def assignment_trees(self, repo, commit, cached_folder):
+        """Папка с заданиями в коммите и хэши деревьев заданий в ней.
+        
+        Сохраненная с прошлой проверки папка проверяется одним вызовом git, поиск по
+        POSSIBLE_ASSIGNMENT_FOLDER_NAMES выполняется, только если ее больше нет.
+        """
+        if cached_folder:
+            trees = self.subtrees(repo, f"{commit}:{cached_folder}")
+            if trees is not None:
+                return cached_folder, trees
+        
+        root = self.subtrees(repo, commit)
+        if root is None:
+            raise RuntimeError(f"не удалось прочитать коммит {commit[:12]}")
+        folder = pick_assignments_folder(sorted(root))
+        if folder is None:
+            return None, {}
+        return folder, (root if folder == "" else self.subtrees(repo, f"{commit}:{folder}") or {})
+
+    def extract(self, repo, commit, student_dir):
+        """Замена папки студента содержимым коммита (git archive)"""
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.checkout_dir, prefix=f".{student_dir.name}."))
+        try:
+            archive = tmp_dir / "submission.tar"
+            returncode, stdout, stderr = self.git(
+                repo, f"archive --format=tar -o {shlex.quote(str(archive))} {commit}")
+            if returncode != 0:
+                raise RuntimeError(f"git archive: {(stdout + stderr).strip()[:200]}")
+            with tarfile.open(archive) as tar:
+                tar.extractall(tmp_dir / "tree", filter="data")
+            if student_dir.exists():
+                shutil.rmtree(student_dir)
+            os.replace(tmp_dir / "tree", student_dir)
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def load_state(self, student_name):
+        try:
+            with open(self.state_dir / f"{student_name}.json", 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def ingest(self, options):
+        """Обновление работ: (папки студентов для проверки, результаты студентов без изменений)"""
+        student_dirs = []
+        unchanged = {}
+        
+        for student_name, repo in self.repositories().items():
+            student_dir = self.checkout_dir / student_name
+            state = self.load_state(student_name)
+            try:
+                commit = self.fetch(repo)
+                folder, trees = self.assignment_trees(repo, commit, state.get("folder"))
+                if state.get("commit") != commit or not student_dir.is_dir():
+                    self.extract(repo, commit, student_dir)
+            except (OSError, RuntimeError, tarfile.TarError) as e:
+                error(f"Работа {student_name} не загружена из {repo}: {e}")
+                continue
+            
+            # Ключ задания: дерево в git, спецификация с опциями запуска и версия проверяющего кода
+            keys = {}
+            for assignment, spec in options.specs.items():
+                tree = trees.get(assignment)
+                spec_json = json.dumps(effective_spec(spec, options), sort_keys=True)
+                keys[assignment] = tree and hashlib.sha256(
+                    f"{tree}\0{spec_json}\0{checker_fingerprint()}".encode("utf-8")
+                ).hexdigest()
+            
+            previous = state.get("result") if not options.no_cache else None
+            previous_keys = state.get("keys", {})
+            reuse = {}
+            if previous is not None and state.get("folder") == folder:
+                for assignment_result in previous["assignments"]:
+                    key = keys.get(assignment_result["name"])
+                    if (key and previous_keys.get(assignment_result["name"]) == key
+                            and not any(check["status"] == "skipped_by_policy"
+                                        for check in assignment_result.get("checks", []))):
+                        reuse[assignment_result["name"]] = assignment_result
+            
+            if previous is not None and previous_keys == keys and state.get("folder") == folder and (
+                    len(reuse) == sum(1 for key in keys.values() if key)):
+                log(f"{student_name}: задания не изменились с проверенного коммита {commit[:12]}")
+                unchanged[student_name] = (previous, None)
+                continue
+            
+            if reuse:
+                log(f"{student_name}: коммит {commit[:12]}, без изменений: {', '.join(sorted(reuse))}")
+            else:
+                log(f"{student_name}: коммит {commit[:12]}")
+            self.ingested[student_name] = {
+                "assignments_folder": None if folder is None else str(student_dir / folder),
+                "reuse": reuse,
+            }
+            self.pending[student_name] = {"commit": commit, "folder": folder, "keys": keys}
+            student_dirs.append(student_dir)
+        
+        return student_dirs, unchanged
+
+    def __call__(self, student_name, student_result, err):
+        """Запись последнего проверенного коммита после успешной проверки студента"""
+        state = self.pending.pop(student_name, None)
+        if state is not None and err is None and student_result is not None:
+            write_json_atomic(self.state_dir / f"{student_name}.json", {**state, "result": student_result})
+
+# =============================================================================
+# ПОИСК ПОХОЖИХ РЕШЕНИЙ
+# =============================================================================
+
+CPP_TOKEN_RE = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')
+  | (?P<preprocessor>^\s*\#[^\n]*)
+  | (?P<number>\b\d[\w.']*)
+  | (?P<identifier>[A-Za-z_]\w*)
+  | (?P<operator>->|::|<<=?|>>=?|[-+*/%&|^!=<>]=?|&&|\|\||\+\+|--|[{}()\[\];,.?:~])
+""", re.VERBOSE | re.DOTALL | re.MULTILINE)
+
+CPP_KEYWORDS = {
+    "auto", "bool", "break", "case", "catch", "char", "class", "const", "constexpr", "continue",
+    "default", "delete", "do", "double", "else", "enum", "explicit", "false", "float", "for",
+    "friend", "if", "inline", "int", "long", "namespace", "new", "noexcept", "nullptr", "operator",
+    "override", "private", "protected", "public", "return", "short", "signed", "sizeof", "static",
+    "struct", "switch", "template", "this", "throw", "true", "try", "typename", "unsigned", "using",
+    "virtual", "void", "volatile", "while",
+}
+
+def tokenize_cpp(source):
+    """Токены C++ без комментариев и директив препроцессора; имена, строки и числа обезличены,
+    чтобы переименование переменных и переформатирование не скрывали совпадения"""
+    tokens = []
+    for match in CPP_TOKEN_RE.finditer(source):
+        kind = match.lastgroup
+        if kind in ("comment", "preprocessor"):
+            continue
+        if kind == "identifier":
+            value = match.group()
+            tokens.append(value if value in CPP_KEYWORDS else "ID")
+        elif kind == "string":
+            tokens.append("STR")
+        elif kind == "number":
+            tokens.append("NUM")
+        else:
+            tokens.append(match.group())
+    return tokens
+
+def winnow_fingerprints(tokens, kgram=None, window=None):
+    """Отпечатки документа (winnowing): минимальные хэши k-грамм в каждом окне"""
+    kgram = kgram or SIMILARITY_KGRAM
+    window = window or SIMILARITY_WINDOW
+    hashes = [int.from_bytes(hashlib.blake2b(" ".join(tokens[i:i + kgram]).encode("utf-8"),
+                                             digest_size=8).digest(), "big")
+              for i in range(len(tokens) - kgram + 1)]
+    if not hashes:
+        return set()
+    if len(hashes) <= window:
+        return {min(hashes)}
+    return {min(hashes[i:i + window]) for i in range(len(hashes) - window + 1)}
+
+@functools.lru_cache(maxsize=None)
+def minhash_parameters(count):
+    """Коэффициенты хэш-функций MinHash h(x) = (a*x + b) mod p, одинаковые во всех запусках"""
+    rng = random.Random(SIMILARITY_SEED)
+    prime = (1 << 61) - 1
+    return prime, [(rng.randrange(1, prime), rng.randrange(prime)) for _ in range(count)]
+
+def minhash_signature(fingerprints):
+    """Сигнатура MinHash множества отпечатков"""
+    prime, parameters = minhash_parameters(SIMILARITY_BANDS * SIMILARITY_ROWS)
+    return [min((a * fp + b) % prime for fp in fingerprints) for a, b in parameters]
+
+def jaccard(first, second):
+    return len(first & second) / len(first | second) if first or second else 0.0
+
+def read_submission_sources(student_dir, assignment):
+    """Исходники задания студента одной строкой или None, если задания нет"""
+    assignments_base_dir = find_assignments_folder(student_dir)
+    if not assignments_base_dir or not (Path(assignments_base_dir) / assignment).is_dir():
+        return None
+    sources = SourceIndex(Path(assignments_base_dir) / assignment)
+    return "\n".join(sources.files.values())
+
+def submission_fingerprints(student_dir, assignment):
+    """Отпечатки решения задания студента или None, если задания или исходников нет"""
+    source = read_submission_sources(student_dir, assignment)
+    return winnow_fingerprints(tokenize_cpp(source)) if source else None
+
+def without_common_fragments(fingerprints):
+    """Отпечатки студентов без фрагментов, общих для большинства (заготовка преподавателя,
+    типовой main) - они не улика"""
+    document_frequency = {}
+    for prints in fingerprints.values():
+        for fp in prints:
+            document_frequency[fp] = document_frequency.get(fp, 0) + 1
+    max_frequency = max(2, int(SIMILARITY_COMMON_FRACTION * len(fingerprints)))
+    return {student: {fp for fp in prints if document_frequency[fp] <= max_frequency}
+            for student, prints in fingerprints.items()}
+
+def similar_pairs(assignment, fingerprints):
+    """Похожие пары по отпечаткам всех студентов одного задания.
+    
+    Кандидаты находятся через LSH по сигнатурам MinHash за почти линейное время,
+    точное сходство (коэффициент Жаккара по отпечаткам) считается только для них.
+    """
+    similar = []
+    fingerprints = without_common_fragments(fingerprints)
+    buckets = {}
+    for student, prints in sorted(fingerprints.items()):
+        if not prints:
+            continue
+        signature = minhash_signature(prints)
+        for band in range(SIMILARITY_BANDS):
+            key = (band, tuple(signature[band * SIMILARITY_ROWS:(band + 1) * SIMILARITY_ROWS]))
+            buckets.setdefault(key, []).append(student)
+    
+    candidates = {(first, second) for students in buckets.values()
+                  for index, first in enumerate(students) for second in students[index + 1:]}
+    for first, second in sorted(candidates):
+        similarity = jaccard(fingerprints[first], fingerprints[second])
+        if similarity >= SIMILARITY_THRESHOLD:
+            similar.append((assignment, first, second, similarity))
+    return similar
+
+class CohortSimilarity:
+    """Похожие решения по всем студентам с отпечатками, сохраненными между перепроверками.
+    
+    При изменении работы студента (режим наблюдения) заново читается только она и
+    сравнивается с остальными; пары остальных студентов между собой не пересчитываются.
+    """
+
+    def __init__(self, student_dirs, assignments):
+        self.assignments = assignments
+        self.fingerprints = {assignment: {} for assignment in assignments}
+        for student_dir in student_dirs:
+            self.read(student_dir)
+        self.similar = {}
+        for assignment in assignments:
+            for _, first, second, similarity in similar_pairs(assignment, self.fingerprints[assignment]):
+                self.similar[(assignment, first, second)] = similarity
+
+    def read(self, student_dir):
+        for assignment in self.assignments:
+            prints = submission_fingerprints(student_dir, assignment)
+            if prints is None:
+                self.fingerprints[assignment].pop(student_dir.name, None)
+            else:
+                self.fingerprints[assignment][student_dir.name] = prints
+
+    def remove(self, student_name):
+        """Студент удален: его отпечатки и пары больше не учитываются"""
+        for assignment in self.assignments:
+            self.fingerprints[assignment].pop(student_name, None)
+        self.similar = {key: similarity for key, similarity in self.similar.items()
+                        if student_name not in key[1:]}
+
+    def update(self, student_dir):
+        """Перечитать работу студента и сравнить ее с работами остальных студентов"""
+        student_name = student_dir.name
+        self.remove(student_name)
+        self.read(student_dir)
+        for assignment in self.assignments:
+            if student_name not in self.fingerprints[assignment]:
+                continue
+            fingerprints = without_common_fragments(self.fingerprints[assignment])
+            prints = fingerprints[student_name]
+            for other, other_prints in fingerprints.items():
+                if other == student_name or not prints:
+                    continue
+                similarity = jaccard(prints, other_prints)
+                if similarity >= SIMILARITY_THRESHOLD:
+                    first, second = sorted((student_name, other))
+                    self.similar[(assignment, first, second)] = similarity
+
+    def pairs(self):
+        """[(задание, студент, студент, сходство)] по убыванию сходства"""
+        similar = [(*key, similarity) for key, similarity in self.similar.items()]
+        similar.sort(key=lambda item: (-item[3], item[0], item[1], item[2]))
+        return similar
+
+def cohort_similarity(options, student_dirs):
+    """CohortSimilarity по всем студентам или None, если поиск похожих решений отключен"""
+    if options.no_similarity:
+        return None
+    log("Поиск похожих решений...")
+    return CohortSimilarity(student_dirs, options.specs)
+
+def write_similarity_section(f, similar_pairs):
+    """Раздел сводного отчета о похожих решениях"""
+    f.write(f"\nПохожие решения (общих фрагментов кода >= {SIMILARITY_THRESHOLD:.0%}):\n")
+    if not similar_pairs:
+        f.write("Не найдено\n")
+    for assignment, first, second, similarity in similar_pairs:
+        f.write(f"{assignment}: {first} - {second}: {similarity:.0%}\n")
+
+def find_student_dirs():
+    """Папки студентов student* в STUDENTS_DIR, по именам"""
+    student_dirs = []
+    app_path = Path(STUDENTS_DIR)
+    if app_path.exists():
+        for item in app_path.iterdir():
+            if item.is_dir() and item.name.startswith("student"):
+                student_dirs.append(item)
+    
+    student_dirs.sort(key=lambda x: x.name)
+    return student_dirs
+
+def write_summary_report(summary_report, results, assignments, similarity=None):
+    """Сводный отчет по всем студентам из результатов проверки.
+    
+    Отчет пишется во временный файл и подменяет старый целиком, так что прерванный
+    запуск не оставляет обрезанный summary_report.txt.
+    """
+    summary_report = Path(summary_report)
+    fd, tmp_name = tempfile.mkstemp(dir=summary_report.parent, prefix=f".{summary_report.name}.")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write("=== СВОДНЫЙ ОТЧЕТ ПО ВСЕМ СТУДЕНТАМ ===\n")
+        f.write(f"Дата проверки: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        f.write(f"Рабочая директория: {os.getcwd()}\n")
+        f.write(f"Проверяемые задания: {', '.join(assignments)}\n")
+        f.write("\n")
+        
+        total_students = 0
+        passed_students = 0
+        all_scores = []
+        
+        # Результаты пишутся в порядке имен, независимо от порядка завершения проверок
+        for student_name in sorted(results):
+            student_result, err = results[student_name]
+            total_students += 1
+            
+            if err is not None or student_result is None:
+                error(f"Ошибка при проверке студента {student_name}: {err}")
+                f.write(f"{student_name}: ОШИБКА ПРОВЕРКИ\n")
+                all_scores.append(0)
+                continue
+            
+            score = student_result["score"]
+            all_scores.append(score)
+            f.write(f"{student_name}: {score} баллов\n")
+            
+            if score >= GRADE_SATISFACTORY:
+                passed_students += 1
+        
+        f.write("\n")
+        f.write("Общая статистика:\n")
+        f.write(f"Всего студентов: {total_students}\n")
+        f.write(f"Прошли (>={GRADE_SATISFACTORY} баллов): {passed_students}\n")
+        
+        if total_students > 0:
+            success_rate = (passed_students * 100) // total_students
+            f.write(f"Процент успешности: {success_rate}%\n")
+            
+            if all_scores:
+                avg_score = sum(all_scores) // len(all_scores)
+                f.write(f"Средний балл: {avg_score}\n")
+                f.write(f"Максимальный балл: {max(all_scores)}\n")
+                f.write(f"Минимальный балл: {min(all_scores)}\n")
 
         f.write("\nРаспределение оценок:\n")
         excellent = sum(1 for score in all_scores if score >= GRADE_EXCELLENT)
@@ -617,6 +2749,821 @@ def main():
         f.write(f"Хорошо ({GRADE_GOOD}-{GRADE_EXCELLENT-1}): {good} студентов\n")
         f.write(f"Удовлетворительно ({GRADE_SATISFACTORY}-{GRADE_GOOD-1}): {satisfactory} студентов\n")
         f.write(f"Неудовлетворительно (<{GRADE_SATISFACTORY}): {unsatisfactory} студентов\n")
+        
+        if similarity is not None:
+            write_similarity_section(f, similarity.pairs())
+        write_timing_tables(f, results)
+    os.replace(tmp_name, summary_report)
+
+# =============================================================================
+# РЕЖИМ НАБЛЮДЕНИЯ ЗА ИЗМЕНЕНИЯМИ
+# =============================================================================
+
+def is_watched_source(path):
+    """Изменения каких файлов требуют перепроверки (артефакты сборки и выводы тестов не учитываются)"""
+    return path.suffix in WATCH_SOURCE_SUFFIXES or path.name in CACHE_SOURCE_NAMES
+
+def watch_fingerprint(student_dir):
+    """Хэш исходников студента, по которому режим наблюдения решает, нужна ли перепроверка"""
+    return hash_assignment_sources(student_dir, WATCH_SOURCE_SUFFIXES)
+
+def changed_student(path):
+    """Имя студента, к папке которого относится изменившийся путь"""
+    try:
+        parts = Path(path).relative_to(STUDENTS_DIR).parts
+    except ValueError:
+        return None
+    if not parts or not parts[0].startswith("student"):
+        return None
+    if len(parts) == 1 or is_watched_source(Path(path)) or Path(path).is_dir():
+        return parts[0]
+    return None
+
+class InotifyWatcher:
+    """Наблюдение за деревьями студентов через inotify (Linux)"""
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_Q_OVERFLOW = 0x4000
+    IN_ISDIR = 0x40000000
+    EVENT_HEADER = struct.Struct("iIII")
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+            | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.watches = {}
+        # Корень - только чтобы заметить появление новых студентов
+        self._add(self.root)
+        for student_dir in find_student_dirs():
+            self._add_tree(student_dir)
+
+    def _add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(str(path)), self.MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+        self.watches[wd] = Path(path)
+
+    def _add_tree(self, directory):
+        for dirpath, dirnames, _ in os.walk(directory):
+            dirnames[:] = [name for name in dirnames if name != ".git"]
+            try:
+                self._add(dirpath)
+            except OSError:
+                continue
+
+    def changes(self, timeout):
+        """Пути, изменившиеся за время ожидания (не дольше timeout секунд)"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set()
+        
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0").decode("utf-8", errors="replace")
+            offset += length
+            
+            if mask & self.IN_Q_OVERFLOW:
+                # События потеряны - считаем изменившимися всех студентов
+                changed.update(find_student_dirs())
+                continue
+            
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            path = directory / name if name else directory
+            if mask & self.IN_ISDIR and mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                if path.parent == self.root and not path.name.startswith("student"):
+                    continue
+                self._add_tree(path)
+            if mask & self.IN_DELETE_SELF:
+                del self.watches[wd]
+            changed.add(path)
+        
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+class PollingWatcher:
+    """Наблюдение опросом времени изменения файлов, если inotify недоступен"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.snapshot = self._scan()
+
+    def _scan(self):
+        snapshot = {}
+        for student_dir in find_student_dirs():
+            snapshot[student_dir] = None
+            for file_path in student_dir.rglob("*"):
+                if ".git" in file_path.parts or not is_watched_source(file_path):
+                    continue
+                try:
+                    stat = file_path.stat()
+                except OSError:
+                    continue
+                snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def changes(self, timeout):
+        """Пути, изменившиеся с прошлого опроса"""
+        time.sleep(timeout)
+        snapshot = self._scan()
+        changed = {path for path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(path, -1) != self.snapshot.get(path, -1)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+def create_watcher(root):
+    """inotify, а при его недоступности - опрос файлов"""
+    try:
+        return InotifyWatcher(root)
+    except (OSError, AttributeError) as e:
+        warning(f"inotify недоступен ({e}), изменения отслеживаются опросом "
+                f"каждые {WATCH_POLL_INTERVAL} сек")
+        return PollingWatcher(root)
+
+def watch_students(args, watcher, fingerprints, results, on_result, summary_report, similarity=None):
+    """Перепроверка студентов, исходники которых изменились, с обновлением сводного отчета.
+    
+    fingerprints - хэши исходников студентов на момент их последней проверки, similarity -
+    CohortSimilarity, в которой обновляются только изменившиеся студенты.
+    Серия изменений собирается, пока не пройдет args.watch_debounce секунд без новых событий.
+    Студент перепроверяется, только если изменился хэш его исходников, а из заданий заново
+    проверяются лишь изменившиеся - остальные берутся из кэша результатов.
+    """
+    log(f"Наблюдение за изменениями в {STUDENTS_DIR} (Ctrl+C - выход)")
+    
+    pending = set()
+    deadline = None
+    try:
+        while True:
+            timeout = WATCH_POLL_INTERVAL if deadline is None else max(0.0, deadline - time.monotonic())
+            students = {changed_student(path) for path in watcher.changes(timeout)} - {None}
+            if students:
+                pending |= students
+                deadline = time.monotonic() + args.watch_debounce
+            
+            if not pending or time.monotonic() < deadline:
+                continue
+            
+            regrade = []
+            for student_name in sorted(pending):
+                student_dir = Path(STUDENTS_DIR) / student_name
+                if not student_dir.is_dir():
+                    log(f"Папка студента {student_name} удалена")
+                    results.pop(student_name, None)
+                    fingerprints.pop(student_name, None)
+                    if similarity is not None:
+                        similarity.remove(student_name)
+                    continue
+                fingerprint = watch_fingerprint(student_dir)
+                if fingerprints.get(student_name) != fingerprint:
+                    fingerprints[student_name] = fingerprint
+                    regrade.append(student_dir)
+            pending.clear()
+            deadline = None
+            
+            if regrade:
+                log(f"Изменения у студентов: {', '.join(d.name for d in regrade)}")
+                results.update(grade_students(regrade, args, on_result=on_result))
+                if similarity is not None:
+                    for student_dir in regrade:
+                        similarity.update(student_dir)
+            write_summary_report(summary_report, results, args.specs, similarity)
+            success(f"Сводный отчет обновлен: {summary_report}")
+    except KeyboardInterrupt:
+        log("Наблюдение остановлено")
+    finally:
+        watcher.close()
+
+# =============================================================================
+# МЕТРИКИ И ПРОГРЕСС ПРОВЕРКИ
+# =============================================================================
+
+def format_duration(seconds):
+    """Длительность для строки прогресса: 1 ч 05 мин, 6 мин 30 сек, 12 сек"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60:02d} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60:02d} сек"
+    return f"{seconds} сек"
+
+def prometheus_labels(labels):
+    """Метки метрики в формате Prometheus: {name="value",...}"""
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class ProgressMetrics:
+    """Ход проверки: счетчики студентов, выполняемые этапы, гистограммы времени этапов и ETA.
+    
+    Получает события report_progress (из процессов пула - через очередь), выводит
+    строку прогресса после каждого проверенного студента и отдает метрики в формате
+    Prometheus. ETA - среднее время последних PROGRESS_WINDOW студентов, умноженное
+    на число оставшихся и поделенное на число параллельных процессов.
+    """
+
+    def __init__(self, jobs):
+        self.lock = threading.Lock()
+        self.jobs = max(1, jobs)
+        self.started = time.monotonic()
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = {}         # Студент -> начало проверки
+        self.running_stages = {}    # (студент, задание, этап) -> начало этапа
+        self.durations = collections.deque(maxlen=PROGRESS_WINDOW)
+        self.stage_buckets = {}     # Этап -> число запусков по корзинам METRICS_STAGE_BUCKETS
+        self.stage_sums = {}        # Этап -> (суммарное время, число запусков)
+        self.stage_timeouts = {}    # Этап -> команд, завершенных по таймауту
+        self.stage_max_rss = {}     # Этап -> пиковая память дочерних процессов, КБ
+
+    def put(self, event):
+        kind, *payload = event
+        with self.lock:
+            line = getattr(self, f"on_{kind}")(*payload)
+        if line:
+            log(line)
+
+    def on_students_queued(self, count):
+        self.total += count
+
+    def on_student_started(self, student):
+        self.in_flight[student] = time.monotonic()
+
+    def on_stage_started(self, student, assignment, stage):
+        # Событие могло прийти из очереди уже после результата студента
+        if student in self.in_flight:
+            self.running_stages[(student, assignment, stage)] = time.monotonic()
+
+    def on_stage_finished(self, student, assignment, stage):
+        self.running_stages.pop((student, assignment, stage), None)
+
+    def on_student_finished(self, student, student_result, err):
+        self.in_flight.pop(student, None)
+        for key in [key for key in self.running_stages if key[0] == student]:
+            del self.running_stages[key]
+        self.completed += 1
+        if err is not None or student_result is None:
+            self.failed += 1
+            return self.progress_line()
+        
+        self.durations.append(student_result.get("duration", 0))
+        for _, check in iter_timed_checks(student_result):
+            name = check["name"]
+            buckets = self.stage_buckets.setdefault(name, [0] * len(METRICS_STAGE_BUCKETS))
+            for index, bound in enumerate(METRICS_STAGE_BUCKETS):
+                if check["duration"] <= bound:
+                    buckets[index] += 1
+            total, count = self.stage_sums.get(name, (0.0, 0))
+            self.stage_sums[name] = (total + check["duration"], count + 1)
+            self.stage_timeouts[name] = self.stage_timeouts.get(name, 0) + sum(
+                1 for command in check["commands"] if command["returncode"] == 124)
+            self.stage_max_rss[name] = max(self.stage_max_rss.get(name, 0), check["max_rss_kb"])
+        return self.progress_line()
+
+    def average_duration(self):
+        return sum(self.durations) / len(self.durations) if self.durations else None
+
+    def eta(self):
+        """Оценка оставшегося времени в секундах или None, пока никто не проверен"""
+        average = self.average_duration()
+        if average is None:
+            return None
+        return average * max(0, self.total - self.completed) / self.jobs
+
+    def progress_line(self):
+        """Краткая строка прогресса: готово/всего, выполняется, ошибки, среднее время и ETA"""
+        percent = 100 * self.completed // self.total if self.total else 100
+        line = f"Прогресс: {self.completed}/{self.total} ({percent}%), проверяется {len(self.in_flight)}"
+        if self.failed:
+            line += f", ошибок {self.failed}"
+        eta = self.eta()
+        if eta is not None:
+            line += (f", в среднем {self.average_duration():.1f} сек на студента, "
+                     f"осталось ~{format_duration(eta)}")
+        return line
+
+    def render(self):
+        """Метрики в текстовом формате Prometheus"""
+        lines = []
+        
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{name}{suffix}{prometheus_labels(labels)} {value}")
+        
+        with self.lock:
+            now = time.monotonic()
+            eta = self.eta()
+            average = self.average_duration()
+            metric("homework_students_total", "gauge", "Студентов к проверке в этом запуске",
+                   [("", {}, self.total)])
+            metric("homework_students_completed_total", "counter", "Проверено студентов",
+                   [("", {}, self.completed)])
+            metric("homework_students_failed_total", "counter", "Студентов, проверка которых завершилась ошибкой",
+                   [("", {}, self.failed)])
+            metric("homework_students_in_flight", "gauge", "Студентов, проверяемых сейчас",
+                   [("", {}, len(self.in_flight))])
+            metric("homework_student_duration_seconds_avg", "gauge",
+                   f"Среднее время проверки последних {PROGRESS_WINDOW} студентов",
+                   [("", {}, round(average, 3))] if average is not None else [])
+            metric("homework_eta_seconds", "gauge", "Оценка оставшегося времени проверки",
+                   [("", {}, round(eta, 1))] if eta is not None else [])
+            metric("homework_uptime_seconds", "gauge", "Время с начала проверки",
+                   [("", {}, round(now - self.started, 1))])
+            
+            samples = []
+            for stage in sorted(self.stage_buckets):
+                for bound, count in zip(METRICS_STAGE_BUCKETS, self.stage_buckets[stage]):
+                    samples.append(("_bucket", {"stage": stage, "le": bound}, count))
+                total, count = self.stage_sums[stage]
+                samples += [("_bucket", {"stage": stage, "le": "+Inf"}, count),
+                            ("_sum", {"stage": stage}, round(total, 3)),
+                            ("_count", {"stage": stage}, count)]
+            metric("homework_stage_duration_seconds", "histogram", "Время выполнения этапов проверки", samples)
+            metric("homework_stage_timeouts_total", "counter", "Внешних команд этапа, завершенных по таймауту",
+                   [("", {"stage": stage}, count) for stage, count in sorted(self.stage_timeouts.items())])
+            metric("homework_stage_max_rss_bytes", "gauge", "Пиковая память дочерних процессов этапа",
+                   [("", {"stage": stage}, rss * 1024) for stage, rss in sorted(self.stage_max_rss.items())])
+            metric("homework_student_running_seconds", "gauge", "Сколько идет проверка студента",
+                   [("", {"student": student}, round(now - started, 1))
+                    for student, started in sorted(self.in_flight.items())])
+            metric("homework_stage_running_seconds", "gauge", "Сколько выполняется текущий этап проверки",
+                   [("", {"student": student, "assignment": assignment, "stage": stage}, round(now - started, 1))
+                    for (student, assignment, stage), started in sorted(self.running_stages.items())])
+        return "\n".join(lines) + "\n"
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """HTTP-обработчик /metrics"""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(metrics, host, port):
+    """HTTP-сервер метрик в фоновом потоке или None, если адрес занят"""
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        warning(f"Сервер метрик не запущен на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log(f"Метрики: http://{host}:{port}/metrics")
+    return server
+
+# =============================================================================
+# РАСПРЕДЕЛЕННАЯ ПРОВЕРКА
+# =============================================================================
+
+class WorkQueue:
+    """Очередь студентов в SQLite на общем томе: координатор добавляет задачи,
+    воркеры берут их в аренду, проверяют и записывают результат.
+    
+    Аренда продлевается, пока воркер проверяет студента; задачи упавших воркеров
+    с истекшей арендой берутся снова, но не больше QUEUE_MAX_ATTEMPTS раз.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # isolation_level=None: транзакции открываются явно через BEGIN IMMEDIATE
+        self.db = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                student TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker TEXT,
+                lease_until REAL,
+                result TEXT,
+                error TEXT,
+                updated_at REAL
+            )""")
+        # Номер запуска: воркер, заставший задачи прошлого запуска, не должен завершаться по ним
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def enqueue(self, student_dirs):
+        """Новый запуск: все студенты снова в статусе pending, номер запуска увеличивается"""
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute("INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                            "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+            self.db.execute("DELETE FROM tasks")
+            self.db.executemany(
+                "INSERT INTO tasks (student, path, status, updated_at) VALUES (?, ?, 'pending', ?)",
+                [(student_dir.name, str(student_dir), now) for student_dir in student_dirs])
+
+    def generation(self):
+        """Номер текущего запуска (0 - очередь еще не заполнялась)"""
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def claim(self, worker):
+        """Взять в аренду следующую задачу: (студент, путь, номер запуска) или None"""
+        now = time.time()
+        with self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            self.db.execute(
+                "UPDATE tasks SET status = 'failed', error = ?, updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (f"воркер не завершил проверку за {QUEUE_MAX_ATTEMPTS} попытки",
+                 now, now, QUEUE_MAX_ATTEMPTS))
+            row = self.db.execute(
+                "SELECT student, path FROM tasks "
+                "WHERE status = 'pending' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY attempts, student LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated_at = ? WHERE student = ?",
+                (worker, now + QUEUE_LEASE_SECONDS, now, row[0]))
+            return (*row, self.generation())
+
+    def renew(self, student, worker):
+        """Продление аренды; False, если задачу уже забрал другой воркер"""
+        now = time.time()
+        with self.db:
+            cursor = self.db.execute(
+                "UPDATE tasks SET lease_until = ?, updated_at = ? "
+                "WHERE student = ? AND worker = ? AND status = 'running'",
+                (now + QUEUE_LEASE_SECONDS, now, student, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, student, worker, student_result, err):
+        """Запись результата; при ошибке задача возвращается в очередь, пока есть попытки"""
+        now = time.time()
+        if err is None:
+            status_sql = "'done'"
+        else:
+            status_sql = f"CASE WHEN attempts >= {QUEUE_MAX_ATTEMPTS} THEN 'failed' ELSE 'pending' END"
+        with self.db:
+            self.db.execute(
+                f"UPDATE tasks SET status = {status_sql}, result = ?, error = ?, lease_until = NULL, "
+                "updated_at = ? WHERE student = ? AND worker = ? AND status = 'running'",
+                (json.dumps(student_result, ensure_ascii=False) if student_result is not None else None,
+                 err, now, student, worker))
+
+    def counts(self):
+        """Количество задач по статусам"""
+        return dict(self.db.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status").fetchall())
+
+    def finished(self):
+        """Все задачи в конечном статусе (очередь не пуста)"""
+        counts = self.counts()
+        return bool(counts) and not counts.get("pending") and not counts.get("running")
+
+    def last_activity(self):
+        """Время последнего изменения задач: постановки, аренды, продления или результата"""
+        return self.db.execute("SELECT MAX(updated_at) FROM tasks").fetchone()[0] or 0
+
+    def abandon(self, reason):
+        """Незавершенные задачи - в failed (координатор больше не ждет воркеров)"""
+        with self.db:
+            self.db.execute("UPDATE tasks SET status = 'failed', error = ?, updated_at = ? "
+                            "WHERE status IN ('pending', 'running')", (reason, time.time()))
+
+    def completed(self, exclude=()):
+        """Завершенные задачи: студент -> (результат, ошибка)"""
+        results = {}
+        for student, status, result, err in self.db.execute(
+                "SELECT student, status, result, error FROM tasks WHERE status IN ('done', 'failed')"):
+            if student not in exclude:
+                results[student] = (json.loads(result) if status == "done" else None,
+                                    None if status == "done" else err or "ошибка проверки")
+        return results
+
+    def close(self):
+        self.db.close()
+
+class LeaseKeeper(threading.Thread):
+    """Фоновое продление аренды задачи, пока воркер ее проверяет"""
+
+    def __init__(self, queue_path, student, worker):
+        super().__init__(daemon=True)
+        self.queue_path = queue_path
+        self.student = student
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self):
+        queue = WorkQueue(self.queue_path)
+        try:
+            while not self.stopped.wait(QUEUE_LEASE_SECONDS / 3):
+                if not queue.renew(self.student, self.worker):
+                    warning(f"Аренда {self.student} потеряна, результат будет записан другим воркером")
+                    return
+        finally:
+            queue.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+def queue_worker_loop(options, slot=0):
+    """Один воркер: берет студентов из очереди, пока она не опустеет.
+    
+    По завершенной очереди воркер выходит, только если сам брал задачи этого
+    запуска: иначе это может быть очередь прошлого запуска, а координатор еще не
+    поставил новых студентов. В остальных случаях выход - по QUEUE_IDLE_EXIT_SECONDS.
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}:{slot}"
+    queue = WorkQueue(options.queue)
+    idle_since = time.monotonic()
+    worked_generation = None
+    graded = 0
+    try:
+        while True:
+            task = queue.claim(worker)
+            if task is None:
+                if ((queue.finished() and queue.generation() == worked_generation)
+                        or time.monotonic() - idle_since > QUEUE_IDLE_EXIT_SECONDS):
+                    return graded
+                time.sleep(QUEUE_POLL_INTERVAL)
+                continue
+            
+            student, path, worked_generation = task
+            log(f"Воркер {worker}: проверка {student}")
+            lease = LeaseKeeper(options.queue, student, worker)
+            lease.start()
+            try:
+                _, student_result, err = grade_student(path, options)
+            finally:
+                lease.stop()
+            queue.complete(student, worker, student_result, err)
+            graded += 1
+            idle_since = time.monotonic()
+    finally:
+        queue.close()
+
+def run_queue_worker(options):
+    """Воркер распределенной проверки, при jobs > 1 - несколько в отдельных процессах"""
+    log(f"Воркер очереди {options.queue}: {options.jobs} процессов")
+    if options.jobs <= 1:
+        graded = queue_worker_loop(options)
+    else:
+        with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+            graded = sum(executor.map(queue_worker_loop, [options] * options.jobs, range(options.jobs)))
+    success(f"Очередь обработана, проверено студентов: {graded}")
+
+def run_queue_coordinator(student_dirs, options, on_result=None):
+    """Координатор: ставит студентов в очередь и собирает результаты воркеров.
+    
+    on_result вызывается по мере того, как воркеры записывают результаты.
+    """
+    queue = WorkQueue(options.queue)
+    try:
+        queue.enqueue(student_dirs)
+        report_progress("students_queued", len(student_dirs))
+        log(f"В очередь {options.queue} добавлено студентов: {len(student_dirs)}, ожидание воркеров...")
+        
+        results = {}
+        progress = None
+        stall_warned = False
+        while True:
+            finished = queue.finished()
+            counts = queue.counts()
+            if counts != progress:
+                progress = counts
+                log("Очередь: " + ", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+            
+            # Работающий воркер продлевает аренду каждые QUEUE_LEASE_SECONDS / 3
+            stalled = time.time() - queue.last_activity()
+            if not finished and stalled > QUEUE_STALL_SECONDS:
+                error(f"Воркеры не брали и не продлевали задачи {stalled:.0f} сек, "
+                      "незавершенные студенты отмечены как ошибка проверки")
+                queue.abandon("нет активных воркеров")
+                finished = True
+            elif not finished and stalled > QUEUE_LEASE_SECONDS and not stall_warned:
+                warning(f"Нет активных воркеров уже {stalled:.0f} сек (ожидание до {QUEUE_STALL_SECONDS} сек)")
+                stall_warned = True
+            elif stalled <= QUEUE_LEASE_SECONDS:
+                stall_warned = False
+            for student_name, (student_result, err) in sorted(queue.completed(exclude=results).items()):
+                results[student_name] = (student_result, err)
+                report_progress("student_finished", student_name, student_result, err)
+                if on_result is not None:
+                    on_result(student_name, student_result, err)
+            if finished or not student_dirs:
+                return results
+            time.sleep(QUEUE_POLL_INTERVAL)
+    finally:
+        queue.close()
+
+def parse_args(argv=None):
+    """Разбор аргументов командной строки"""
+    parser = argparse.ArgumentParser(description="Автоматическая проверка домашних заданий по C++")
+    parser.add_argument("-j", "--jobs", type=int, default=DEFAULT_JOBS,
+                        help="количество студентов, проверяемых параллельно "
+                             f"(по умолчанию {DEFAULT_JOBS}, 0 - по числу ядер)")
+    parser.add_argument("--stage-jobs", type=int, default=DEFAULT_STAGE_JOBS,
+                        help="количество одновременно выполняемых этапов проверки одного задания "
+                             f"(по умолчанию {DEFAULT_STAGE_JOBS}, 1 - последовательно)")
+    parser.add_argument("--build-cache", action="store_true",
+                        help="собирать через общий ccache и пропускать make clean, "
+                             "если исходники не изменились с прошлой сборки")
+    parser.add_argument("--no-workspace", dest="workspace", action="store_false",
+                        help="собирать и проверять прямо в каталоге студента, "
+                             f"а не в его копии в {WORKSPACE_ROOT}")
+    parser.add_argument("--build-cache-dir", default=BUILD_CACHE_DIR,
+                        help=f"каталог кэша сборки (по умолчанию {BUILD_CACHE_DIR})")
+    parser.add_argument("--cppcheck-build-dir", default=CPPCHECK_BUILD_DIR,
+                        help="каталог результатов cppcheck для инкрементального анализа "
+                             f"(по умолчанию {CPPCHECK_BUILD_DIR})")
+    parser.add_argument("--memory-check", choices=["sanitizer", "valgrind"],
+                        help="способ проверки памяти для всех заданий "
+                             "(по умолчанию - из спецификации задания)")
+    parser.add_argument("--memory-input", metavar="FILE",
+                        help="файл, подаваемый на стандартный ввод программам при проверке памяти "
+                             "(по умолчанию - из спецификации задания)")
+    parser.add_argument("--policy", choices=GRADING_POLICIES, default=DEFAULT_GRADING_POLICY,
+                        help="политика проверки: full - все этапы, early-exit - пропускать дорогие "
+                             "этапы (clang-tidy, проверка памяти), если оценка уже не изменится, "
+                             f"fast - не запускать их (по умолчанию {DEFAULT_GRADING_POLICY})")
+    parser.add_argument("--fast", dest="policy", action="store_const", const="fast",
+                        help="быстрая предварительная проверка, то же что --policy fast")
+    parser.add_argument("--spec", metavar="FILE",
+                        help="JSON-файл со спецификацией заданий: этапы проверки, их настройки и штрафы "
+                             "(по умолчанию - ASSIGNMENT_SPECS)")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="сохранить время этапов и команд в формате Chrome Trace (JSON)")
+    parser.add_argument("--watch", action="store_true",
+                        help="после проверки следить за папками студентов и перепроверять "
+                             "тех, чьи исходники изменились")
+    parser.add_argument("--watch-debounce", type=float, default=WATCH_DEBOUNCE_SECONDS,
+                        help="сколько секунд ждать окончания серии изменений перед перепроверкой "
+                             f"(по умолчанию {WATCH_DEBOUNCE_SECONDS})")
+    parser.add_argument("--git-mirrors", metavar="DIR",
+                        help="брать работы из локальных bare-репозиториев DIR/student*.git: "
+                             f"забрать новые коммиты, извлечь их в {GIT_CHECKOUT_DIR} и проверить "
+                             "только изменившиеся задания")
+    parser.add_argument("--queue", metavar="DB",
+                        help="распределенная проверка через очередь SQLite на общем томе: "
+                             "без --worker - поставить студентов в очередь и собрать результаты")
+    parser.add_argument("--worker", action="store_true",
+                        help="проверять студентов из очереди --queue, пока она не опустеет")
+    parser.add_argument("--resume", action="store_true",
+                        help="продолжить прерванную проверку: студенты из журнала прошлого запуска "
+                             "не проверяются заново")
+    parser.add_argument("--no-similarity", action="store_true",
+                        help="не искать похожие решения студентов")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="отдавать метрики хода проверки в формате Prometheus "
+                             "на http://HOST:PORT/metrics")
+    parser.add_argument("--metrics-host", default=METRICS_HOST,
+                        help=f"адрес сервера метрик (по умолчанию {METRICS_HOST}; "
+                             "0.0.0.0 - доступ извне контейнера)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="не использовать кэш результатов, проверять все задания заново")
+    parser.add_argument("--cache-dir", default=CACHE_DIR,
+                        help=f"каталог кэша результатов (по умолчанию {CACHE_DIR})")
+    args = parser.parse_args(argv)
+    if args.jobs <= 0:
+        args.jobs = os.cpu_count() or 1
+    if args.worker and not args.queue:
+        parser.error("--worker требует --queue")
+    if args.queue and args.watch:
+        parser.error("--watch не поддерживается вместе с --queue")
+    if args.git_mirrors and args.watch:
+        parser.error("--watch не поддерживается вместе с --git-mirrors")
+    try:
+        args.specs = load_assignment_specs(args.spec)
+    except (OSError, ValueError) as e:
+        parser.error(f"спецификация заданий: {e}")
+    args.ingested = {}  # Заполняется при загрузке работ из git-зеркал
+    return args
+
+def main(argv=None):
+    """Основная функция"""
+    args = parse_args(argv)
+    log("Начало проверки домашних заданий")
+    if _prlimit_path() is None:
+        error("Не найдена утилита prlimit (util-linux): команды студентов нельзя запустить с ограничениями ресурсов")
+        sys.exit(1)
+
+    script_dir = Path(__file__).parent.absolute()
+    os.chdir(script_dir)
+    
+    if args.worker:
+        run_queue_worker(args)
+        return
+
+    reports_path = Path(REPORTS_DIR)
+    reports_path.mkdir(parents=True, exist_ok=True)
+    
+    summary_report = reports_path / "summary_report.txt"
+    
+    progress = ProgressMetrics(args.jobs)
+    set_progress_events(progress)
+    metrics_server = start_metrics_server(progress, args.metrics_host, args.metrics_port) if args.metrics_port else None
+    
+    ingestion = None
+    unchanged = {}
+    if args.git_mirrors:
+        log(f"Загрузка работ из git-зеркал {args.git_mirrors}...")
+        ingestion = GitIngestion(args.git_mirrors)
+        student_dirs, unchanged = ingestion.ingest(args)
+        args.ingested = ingestion.ingested
+        log(f"К проверке: {len(student_dirs)}, без изменений: {len(unchanged)}")
+        all_student_dirs = sorted(student_dirs + [ingestion.checkout_dir / name for name in unchanged],
+                                  key=lambda x: x.name)
+    else:
+        log("Поиск папок студентов...")
+        student_dirs = find_student_dirs()
+        all_student_dirs = student_dirs
+    
+    # Наблюдение начинается до проверки, чтобы не пропустить изменения во время нее
+    watcher = create_watcher(STUDENTS_DIR) if args.watch else None
+    fingerprints = {student_dir.name: watch_fingerprint(student_dir)
+                    for student_dir in student_dirs} if args.watch else {}
+    
+    journal = RunJournal(reports_path / RUN_JOURNAL_DIR, resume=args.resume)
+    completed = {}
+    if args.resume:
+        student_names = {student_dir.name for student_dir in student_dirs}
+        completed = {name: entry for name, entry in journal.load().items() if name in student_names}
+        student_dirs = [student_dir for student_dir in student_dirs if student_dir.name not in completed]
+        log(f"Продолжение проверки: уже проверено {len(completed)}, осталось {len(student_dirs)}")
+    
+    jsonl_writer = JsonlWriter(reports_path / RESULTS_JSONL)
+    
+    def on_result(student_name, student_result, err):
+        journal(student_name, student_result, err)
+        if ingestion is not None:
+            ingestion(student_name, student_result, err)
+        jsonl_writer(student_name, student_result, err)
+    
+    # Студенты без новых коммитов в заданиях - с результатом последней проверки
+    completed = {**unchanged, **completed}
+    
+    try:
+        for student_name, (student_result, err) in sorted(completed.items()):
+            jsonl_writer(student_name, student_result, err)
+        
+        if args.queue:
+            graded = run_queue_coordinator(student_dirs, args, on_result=on_result)
+        else:
+            graded = grade_students(student_dirs, args, on_result=on_result)
+        # Сводный отчет - по журналу прошлого запуска и результатам этого
+        results = {**completed, **graded}
+        similarity = cohort_similarity(args, all_student_dirs)
+        write_summary_report(summary_report, results, args.specs, similarity)
+        
+        if watcher is not None:
+            watch_students(args, watcher, fingerprints, results, on_result, summary_report, similarity)
+    finally:
+        jsonl_writer.close()
+        set_progress_events(None)
+        if metrics_server is not None:
+            metrics_server.shutdown()
+    
+    if args.trace:
+        write_chrome_trace(args.trace, results)
+        log(f"Трасса времени проверки сохранена в {args.trace}")
     
     log(f"Проверка завершена. Отчеты сохранены в {REPORTS_DIR}")
     success(f"Сводный отчет: {summary_report}")